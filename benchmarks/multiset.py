@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks the multiset_union_update and multiset_intersection_update
+atoms behind MultiSet's |= and &= operators, against a hash with a
+large number of fields, comparing them with their previous versions,
+which made a call per field, and rebuilt the whole hash for
+intersections. Requires a running Redis server, eg:
+
+    $ python benchmarks/multiset.py --fields 1000000 --port 6379
+
+Half of the fields given to each operation overlap with those
+already in the hash, with random counts either side.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hot_redis
+
+
+PREVIOUS_INTERSECTION_UPDATE = """
+local keys_values = redis.call('HGETALL', KEYS[1])
+local all = {}
+for i = 1, #keys_values, 2 do
+    all[keys_values[i]] = keys_values[i+1]
+end
+redis.call('DEL', KEYS[1])
+for i = 1, #ARGV, 2 do
+    local current = tonumber(all[ARGV[i]])
+    local new = tonumber(ARGV[i+1])
+    if new > 0 and current then
+        redis.call('HSET', KEYS[1], ARGV[i], math.min(new, current))
+    end
+end
+"""
+
+PREVIOUS_UNION_UPDATE = """
+for i = 1, #ARGV, 2 do
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    local new = tonumber(ARGV[i+1])
+    if new > 0 and (not current or new > current) then
+        redis.call('HSET', KEYS[1], ARGV[i], new)
+    end
+end
+"""
+
+
+def populate(client, key, counts, chunk_size=10000):
+    client.delete(key)
+    items = list(counts.items())
+    for i in range(0, len(items), chunk_size):
+        client.hset(key, mapping=dict(items[i:i + chunk_size]))
+
+
+def flatten(counts):
+    args = []
+    for field, count in counts.items():
+        args.extend((field, count))
+    return args
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--fields", type=int, default=1000000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    hot_redis.configure(host=options.host, port=options.port)
+    client = hot_redis.default_client()
+    key = "hot-redis-benchmark-multiset"
+    fields = options.fields
+    current = dict([("field%s" % i, random.randint(1, 100))
+                    for i in range(fields)])
+    other = dict([("field%s" % i, random.randint(1, 100))
+                  for i in range(fields // 2, fields + fields // 2)])
+    args = flatten(other)
+
+    previous = {
+        "union_update": client.register_script(PREVIOUS_UNION_UPDATE),
+        "intersection_update":
+            client.register_script(PREVIOUS_INTERSECTION_UPDATE),
+    }
+    atoms = {
+        "union_update": client.multiset_union_update,
+        "intersection_update": client.multiset_intersection_update,
+    }
+
+    print("%s fields, best of %s" % (fields, options.repeat))
+    try:
+        for name in ("union_update", "intersection_update"):
+            for version, run in (
+                    ("previous", lambda: previous[name](keys=[key],
+                                                        args=args)),
+                    ("current", lambda: atoms[name](key, *args))):
+                timings = []
+                for _ in range(options.repeat):
+                    populate(client, key, current)
+                    start = time.time()
+                    run()
+                    timings.append(time.time() - start)
+                print("%-20s %-9s %.3fs" % (name, version, min(timings)))
+    finally:
+        client.delete(key)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,8 @@ except ImportError:
 else:
     from .types import *
     from .client import *
+    from .codec import *
+    from .expressions import *
+    from .worker import *
 
 __version__ = "0.3"
@@ -5,6 +5,8 @@ import threading
 
 import redis
 
+from .codec import ENCODING_ERRORS
+
 
 class HotClient(redis.Redis):
     """
@@ -14,7 +16,9 @@ class HotClient(redis.Redis):
 
     def __init__(self, *args, **kwargs):
         kwargs.setdefault("decode_responses", True)
+        kwargs.setdefault("encoding_errors", ENCODING_ERRORS)
         super(HotClient, self).__init__(*args, **kwargs)
+        self._lua_scripts = {}
         requires_luabit = ("number_and", "number_or", "number_xor",
                            "number_lshift", "number_rshift")
         with open(self._get_lua_path("bit.lua")) as f:
@@ -55,6 +59,21 @@ class HotClient(redis.Redis):
         setattr(script, "name", name)  # Helps debugging redis lib.
         method = lambda key, *a, **k: script(keys=[key], args=a, **k)
         setattr(self, name, method)
+        self._lua_scripts[name] = script
+
+    def pipeline(self, *args, **kwargs):
+        """
+        Binds each of the Lua methods to the pipeline, so that they
+        can be called within transactions like regular methods.
+        """
+        pipe = super(HotClient, self).pipeline(*args, **kwargs)
+        for name, script in self._lua_scripts.items():
+            setattr(pipe, name, self._bind_script(script, pipe))
+        return pipe
+
+    def _bind_script(self, script, pipe):
+        return lambda key, *a, **k: script(keys=[key], args=a,
+                                           client=pipe, **k)
 
 
 _thread = threading.local()
@@ -0,0 +1,256 @@
+
+import json
+import pickle
+import struct
+import time
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+
+# Responses from HotClient are decoded using surrogateescape where
+# available (Python 3), which allows binary values to survive the trip
+# back from Redis as text, and be recovered here byte for byte.
+try:
+    "".encode("utf-8", "surrogateescape")
+except LookupError:
+    ENCODING_ERRORS = "strict"
+else:
+    ENCODING_ERRORS = "surrogateescape"
+
+
+def to_bytes(value):
+    """
+    Returns the raw bytes for a value read back from Redis, which
+    may have been decoded to text by the client.
+    """
+    if isinstance(value, bytes):
+        return value
+    return value.encode("utf-8", ENCODING_ERRORS)
+
+
+class Codec(object):
+    """
+    Base codec that all others inherit. A codec converts values to
+    and from their stored Redis representation, and can be given to
+    any of the container types via their ``codec`` arg. The bulk
+    methods are used on the read paths that return many values at
+    once, such as HGETALL, LRANGE and SMEMBERS, and may be overridden
+    where a codec can do better than one call per value.
+    """
+
+    def encode(self, value):
+        raise NotImplementedError
+
+    def decode(self, value):
+        raise NotImplementedError
+
+    def encode_many(self, values):
+        return [self.encode(value) for value in values]
+
+    def decode_many(self, values):
+        return [self.decode(value) for value in values]
+
+
+class JSONCodec(Codec):
+    """
+    Stores values as JSON text. Any keyword args are passed onto
+    ``json.dumps``.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("separators", (",", ":"))
+        self.kwargs = kwargs
+
+    def encode(self, value):
+        return json.dumps(value, **self.kwargs)
+
+    def decode(self, value):
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return json.loads(value)
+
+
+class PickleCodec(Codec):
+    """
+    Stores values pickled, using the highest protocol available
+    by default.
+    """
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def encode(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def decode(self, value):
+        return pickle.loads(to_bytes(value))
+
+
+class StructCodec(Codec):
+    """
+    Stores values packed with the given ``struct`` format. Formats
+    with a single field encode and decode scalars, otherwise tuples.
+    Bulk decoding unpacks all values in a single pass.
+    """
+
+    def __init__(self, fmt):
+        self.struct = struct.Struct(fmt)
+        self.scalar = len(self.struct.unpack(b"\0" * self.struct.size)) == 1
+
+    def encode(self, value):
+        if self.scalar:
+            return self.struct.pack(value)
+        return self.struct.pack(*value)
+
+    def decode(self, value):
+        values = self.struct.unpack(to_bytes(value))
+        return values[0] if self.scalar else values
+
+    def decode_many(self, values):
+        data = b"".join([to_bytes(value) for value in values])
+        try:
+            unpacked = self.struct.iter_unpack(data)
+        except AttributeError:
+            # Python 2.
+            size = self.struct.size
+            unpacked = [self.struct.unpack_from(data, i)
+                        for i in range(0, len(data), size)]
+        if self.scalar:
+            return [values[0] for values in unpacked]
+        return list(unpacked)
+
+
+class MsgpackCodec(Codec):
+    """
+    Stores values serialized with msgpack, which must be installed.
+    Any keyword args are passed onto ``msgpack.unpackb``.
+    """
+
+    def __init__(self, **kwargs):
+        if msgpack is None:
+            raise ImportError("MsgpackCodec requires the msgpack package")
+        kwargs.setdefault("raw", False)
+        self.kwargs = kwargs
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, value):
+        return msgpack.unpackb(to_bytes(value), **self.kwargs)
+
+
+class CompressionCodec(Codec):
+    """
+    Base codec for compressing values, optionally wrapping another
+    codec whose output is compressed. Values shorter than
+    ``threshold`` bytes are stored as is. Every stored value is
+    prefixed with a single header byte, flagging whether the value
+    was compressed, and whether it should be decoded back to text.
+
+    Running totals are kept in ``stats``, from which ``ratio`` is
+    calculated for the values encoded so far.
+    """
+
+    COMPRESSED = 1
+    TEXT = 2
+
+    def __init__(self, codec=None, threshold=1024):
+        self.codec = codec
+        self.threshold = threshold
+        self.stats = {
+            "encoded": 0,
+            "compressed": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+            "compress_time": 0.,
+            "decompress_time": 0.,
+        }
+
+    @property
+    def ratio(self):
+        if not self.stats["stored_bytes"]:
+            return 1.
+        return float(self.stats["raw_bytes"]) / self.stats["stored_bytes"]
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+    def encode(self, value):
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        flags = 0
+        if not isinstance(value, bytes):
+            value = value.encode("utf-8")
+            flags |= self.TEXT
+        self.stats["encoded"] += 1
+        self.stats["raw_bytes"] += len(value)
+        if len(value) >= self.threshold:
+            start = time.time()
+            compressed = self.compress(value)
+            self.stats["compress_time"] += time.time() - start
+            if len(compressed) < len(value):
+                value = compressed
+                flags |= self.COMPRESSED
+                self.stats["compressed"] += 1
+        self.stats["stored_bytes"] += len(value) + 1
+        return struct.pack("B", flags) + value
+
+    def decode(self, value):
+        value = to_bytes(value)
+        flags = struct.unpack("B", value[:1])[0]
+        value = value[1:]
+        if flags & self.COMPRESSED:
+            start = time.time()
+            value = self.decompress(value)
+            self.stats["decompress_time"] += time.time() - start
+        if flags & self.TEXT:
+            value = value.decode("utf-8")
+        if self.codec is not None:
+            value = self.codec.decode(value)
+        return value
+
+
+class ZlibCodec(CompressionCodec):
+    """
+    Compresses values with zlib at the given ``level``.
+    """
+
+    def __init__(self, codec=None, threshold=1024, level=6):
+        super(ZlibCodec, self).__init__(codec=codec, threshold=threshold)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Codec(CompressionCodec):
+    """
+    Compresses values with LZ4, which must be installed. Trades some
+    compression ratio against ZlibCodec for much less CPU time.
+    """
+
+    def __init__(self, codec=None, threshold=1024):
+        if lz4 is None:
+            raise ImportError("LZ4Codec requires the lz4 package")
+        super(LZ4Codec, self).__init__(codec=codec, threshold=threshold)
+
+    def compress(self, data):
+        return lz4.block.compress(data)
+
+    def decompress(self, data):
+        return lz4.block.decompress(data)
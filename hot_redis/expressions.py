@@ -0,0 +1,329 @@
+
+import uuid
+
+from .client import default_client
+from .types import Base, Buffered, Float, Int, Set, ShardedInt
+
+
+class Expression(object):
+    """
+    Lazily evaluated expression built from operators applied to HOT
+    Redis objects and constants. Rather than reading each operand's
+    value into Python, the whole expression tree is compiled into a
+    single Lua script, so that compound arithmetic on Int/Float
+    objects, or algebra on Set objects (using SINTERSTORE,
+    SUNIONSTORE and SDIFFSTORE), runs in one round trip without any
+    intermediate values being transferred.
+
+    Expressions are created by wrapping an object with ``lazy``, and
+    then executed with ``evaluate`` or ``store``.
+    """
+
+    numeric_ops = {
+        "+": "(%s + %s)",
+        "-": "(%s - %s)",
+        "*": "(%s * %s)",
+        "/": "(%s / %s)",
+        "//": "math.floor(%s / %s)",
+        "%": "(%s %% %s)",
+        "**": "(%s ^ %s)",
+    }
+
+    set_ops = {
+        "&": "SINTERSTORE",
+        "|": "SUNIONSTORE",
+        "-": "SDIFFSTORE",
+    }
+
+    def __init__(self, op=None, operands=()):
+        self.op = op
+        self.operands = operands
+
+    def __repr__(self):
+        if self.op is None:
+            return "lazy(%r)" % self.operands[0]
+        return "(%r %s %r)" % (self.operands[0], self.op, self.operands[1])
+
+    def _operate(self, op, other, right=False):
+        other = other if isinstance(other, Expression) else lazy(other)
+        operands = (other, self) if right else (self, other)
+        return Expression(op, operands)
+
+    def __add__(self, other):
+        return self._operate("+", other)
+
+    def __sub__(self, other):
+        return self._operate("-", other)
+
+    def __mul__(self, other):
+        return self._operate("*", other)
+
+    def __truediv__(self, other):
+        return self._operate("/", other)
+
+    __div__ = __truediv__
+
+    def __floordiv__(self, other):
+        return self._operate("//", other)
+
+    def __mod__(self, other):
+        return self._operate("%", other)
+
+    def __pow__(self, other):
+        return self._operate("**", other)
+
+    def __and__(self, other):
+        return self._operate("&", other)
+
+    def __or__(self, other):
+        return self._operate("|", other)
+
+    def __xor__(self, other):
+        return self._operate("^", other)
+
+    def __radd__(self, other):
+        return self._operate("+", other, right=True)
+
+    def __rsub__(self, other):
+        return self._operate("-", other, right=True)
+
+    def __rmul__(self, other):
+        return self._operate("*", other, right=True)
+
+    def __rtruediv__(self, other):
+        return self._operate("/", other, right=True)
+
+    __rdiv__ = __rtruediv__
+
+    def __rfloordiv__(self, other):
+        return self._operate("//", other, right=True)
+
+    def __rmod__(self, other):
+        return self._operate("%", other, right=True)
+
+    def __rpow__(self, other):
+        return self._operate("**", other, right=True)
+
+    def __rand__(self, other):
+        return self._operate("&", other, right=True)
+
+    def __ror__(self, other):
+        return self._operate("|", other, right=True)
+
+    def __rxor__(self, other):
+        return self._operate("^", other, right=True)
+
+    def leaves(self):
+        """
+        Yields each of the objects and constants in the expression.
+        """
+        if self.op is None:
+            yield self.operands[0]
+        else:
+            for operand in self.operands:
+                for leaf in operand.leaves():
+                    yield leaf
+
+    def ops(self):
+        """
+        Yields each of the operators in the expression.
+        """
+        if self.op is not None:
+            yield self.op
+            for operand in self.operands:
+                for op in operand.ops():
+                    yield op
+
+    @property
+    def is_set(self):
+        return any([isinstance(leaf, (Set, set, frozenset))
+                    for leaf in self.leaves()])
+
+    @property
+    def is_int(self):
+        for leaf in self.leaves():
+            if (not isinstance(leaf, (Int, ShardedInt, int)) or
+                    isinstance(leaf, bool)):
+                return False
+        return "/" not in self.ops()
+
+    def _set_leaf(self):
+        """
+        Returns the first Set in the expression, whose codec is used
+        for the set constants and results.
+        """
+        for leaf in self.leaves():
+            if isinstance(leaf, Set):
+                return leaf
+
+    def _client(self):
+        for leaf in self.leaves():
+            if isinstance(leaf, Base) and leaf.client is not None:
+                return leaf.client
+        return default_client()
+
+    def _compile_numeric(self, keys, args):
+        if self.op is None:
+            leaf = self.operands[0]
+            get = "(tonumber(redis.call('GET', KEYS[%s])) or 0)"
+            if isinstance(leaf, ShardedInt):
+                gets = []
+                for key in leaf.shard_keys:
+                    keys.append(key)
+                    gets.append(get % len(keys))
+                return "(%s)" % " + ".join(gets)
+            if isinstance(leaf, (Int, Float)):
+                keys.append(leaf.key)
+                return get % len(keys)
+            if isinstance(leaf, Base):
+                raise TypeError("%s can't be used in numeric expressions" %
+                                leaf.__class__.__name__)
+            args.append(leaf)
+            return "tonumber(ARGV[%s])" % len(args)
+        if self.op not in self.numeric_ops:
+            raise TypeError("Unsupported numeric operator: %s" % self.op)
+        left, right = [operand._compile_numeric(keys, args)
+                       for operand in self.operands]
+        return self.numeric_ops[self.op] % (left, right)
+
+    def _compile_set(self, keys, args, lines, temps, codec_leaf):
+        """
+        Adds the Lua lines for storing the expression in a temporary
+        key, returning the Lua expression for the key holding the
+        expression's result.
+        """
+        if self.op is None:
+            leaf = self.operands[0]
+            if isinstance(leaf, Set):
+                keys.append(leaf.key)
+                return "KEYS[%s]" % len(keys)
+            if not isinstance(leaf, (set, frozenset)):
+                raise TypeError("Sets can't be combined with %r" % leaf)
+            temp = self._temp(lines, temps)
+            if codec_leaf is not None:
+                leaf = codec_leaf._encode_many(list(leaf))
+            # Constants are passed as their size followed by their
+            # members, read from the ARGV position held in n, so that
+            # the script is the same for any size of constant.
+            args.append(len(leaf))
+            args.extend(leaf)
+            lines.append("for i = n + 1, n + ARGV[n] do "
+                         "redis.call('SADD', %s, ARGV[i]) end" % temp)
+            lines.append("n = n + 1 + ARGV[n]")
+            return temp
+        left, right = [operand._compile_set(keys, args, lines, temps,
+                                            codec_leaf)
+                       for operand in self.operands]
+        temp = self._temp(lines, temps)
+        if self.op == "^":
+            diffs = (self._temp(lines, temps), self._temp(lines, temps))
+            lines.append("redis.call('SDIFFSTORE', %s, %s, %s)" %
+                         (diffs[0], left, right))
+            lines.append("redis.call('SDIFFSTORE', %s, %s, %s)" %
+                         (diffs[1], right, left))
+            left, right = diffs
+            command = "SUNIONSTORE"
+        elif self.op in self.set_ops:
+            command = self.set_ops[self.op]
+        else:
+            raise TypeError("Unsupported set operator: %s" % self.op)
+        lines.append("redis.call('%s', %s, %s, %s)" %
+                     (command, temp, left, right))
+        return temp
+
+    def _temp(self, lines, temps):
+        temps.append("t[%s]" % (len(temps) + 1))
+        lines.append("%s = ARGV[1] .. 't%s'" % (temps[-1], len(temps)))
+        return temps[-1]
+
+    def _compile(self, store=None):
+        """
+        Returns the Lua script for the expression, with the keys and
+        args to run it with. The script only depends on the shape of
+        the expression, not on its values, so that expressions of
+        the same shape share a single cached script.
+        """
+        keys, args, lines = [], [], []
+        if self.is_set:
+            temps = []
+            args.append("%s-expression-" % uuid.uuid4())
+            lines.append("local n = 2")
+            result = self._compile_set(keys, args, lines, temps,
+                                       self._set_leaf())
+            if store is None:
+                lines.append("return redis.call('SMEMBERS', %s)" % result)
+            else:
+                keys.append(store)
+                lines.append("redis.call('SUNIONSTORE', KEYS[%s], %s)" %
+                             (len(keys), result))
+            # Run in pcall so that the temporary keys are deleted, even
+            # if a command fails partway through.
+            lines = ["local t = {}",
+                     "local ok, result = pcall(function()"] + lines + [
+                     "end)",
+                     "if #t > 0 then redis.call('DEL', unpack(t)) end",
+                     "if not ok then error(result) end",
+                     "return result"]
+        else:
+            result = self._compile_numeric(keys, args)
+            lines.append("local result = string.format('%%.17g', %s)" %
+                         result)
+            if store is not None:
+                keys.append(store)
+                lines.append("redis.call('SET', KEYS[%s], result)" %
+                             len(keys))
+            lines.append("return result")
+        return "\n".join(lines), keys, args
+
+    def _run(self, store=None):
+        # Buffered increments are written first, so they're included.
+        for leaf in self.leaves():
+            if isinstance(leaf, Buffered):
+                leaf.flush()
+        script, keys, args = self._compile(store)
+        client = self._client()
+        script = client.register_script(script)
+        return script(keys=keys, args=args, client=client)
+
+    def evaluate(self):
+        """
+        Runs the expression and returns its value.
+        """
+        result = self._run()
+        if self.is_set:
+            leaf = self._set_leaf()
+            if leaf is not None:
+                result = leaf._decode_many(result)
+            return set(result)
+        result = float(result)
+        if self.is_int and result.is_integer():
+            return int(result)
+        return result
+
+    def store(self, key=None):
+        """
+        Runs the expression, storing its value in the given key, or a
+        generated key if none is given. Returns a Set, Int or Float
+        object for the stored value.
+        """
+        key = key or str(uuid.uuid4())
+        self._run(store=key)
+        client = self._client()
+        if self.is_set:
+            leaf = self._set_leaf()
+            codec = leaf.codec if leaf is not None else None
+            return Set(key=key, client=client, codec=codec)
+        elif self.is_int:
+            return Int(key=key, client=client)
+        return Float(key=key, client=client)
+
+
+def lazy(obj):
+    """
+    Wraps a HOT Redis object or constant in an Expression, so that
+    operators applied to it build an expression for running within
+    Redis, rather than being applied immediately.
+    """
+    if isinstance(obj, Expression):
+        return obj
+    return Expression(operands=(obj,))
@@ -98,6 +98,25 @@ function string_setitem()
     redis.call('SET', KEYS[1], s)
 end
 
+function immutable_string_append()
+    local release = ARGV[3] == '1'
+    if release and redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('RENAME', KEYS[1], ARGV[1])
+        redis.call('APPEND', ARGV[1], ARGV[2])
+    else
+        local s = redis.call('GET', KEYS[1]) or ''
+        redis.call('SET', ARGV[1], s .. ARGV[2])
+    end
+end
+
+function immutable_string_multiply()
+    local s = redis.call('GET', KEYS[1]) or ''
+    redis.call('SET', ARGV[1], string.rep(s, tonumber(ARGV[2])))
+    if ARGV[3] == '1' then
+        redis.call('DEL', KEYS[1])
+    end
+end
+
 function number_multiply()
     local n = tonumber(redis.call('GET', KEYS[1])) * tonumber(ARGV[1])
     redis.call('SET', KEYS[1], n)
@@ -148,38 +167,616 @@ function number_rshift()
     redis.call('SET', KEYS[1], n)
 end
 
+function sharded_number_op()
+    local n = tonumber(redis.call('GET', KEYS[1])) or 0
+    for i = 3, #ARGV do
+        n = n + (tonumber(redis.call('GET', ARGV[i])) or 0)
+        redis.call('DEL', ARGV[i])
+    end
+    local op = ARGV[1]
+    local x = tonumber(ARGV[2])
+    if op == 'multiply' then
+        n = n * x
+    elseif op == 'divide' then
+        n = n / x
+    elseif op == 'floordiv' then
+        n = math.floor(n / x)
+    elseif op == 'mod' then
+        n = n % x
+    elseif op == 'pow' then
+        n = n ^ x
+    end
+    redis.call('SET', KEYS[1], n)
+end
+
 function queue_put()
     local size = redis.call('LLEN', KEYS[1])
+    local maxsize = tonumber(ARGV[1])
+    local count = #ARGV - 4
+    if size + count > maxsize then
+        -- Blocking producers register as waiting for space, so that
+        -- consumers only push space tokens for them.
+        if ARGV[4] ~= '' then
+            redis.call('INCR', ARGV[4] .. '-waiters')
+        end
+        return 0
+    end
+    for i = 5, #ARGV, 1000 do
+        local last = math.min(i + 999, #ARGV)
+        redis.call(ARGV[2], KEYS[1], unpack(ARGV, i, last))
+    end
+    if ARGV[3] ~= '' then
+        redis.call('HINCRBY', ARGV[3], 'unfinished', count)
+    end
+    return 1
+end
+
+function queue_pop()
+    local item = redis.call('LPOP', KEYS[1])
+    if item then
+        -- A token is pushed for each producer registered as waiting for
+        -- space, up to the number of items taken.
+        if tonumber(ARGV[2]) > 0 then
+            local waiters = ARGV[1] .. '-waiters'
+            local tokens = math.min(1,
+                                   tonumber(redis.call('GET', waiters) or 0))
+            if tokens > 0 then
+                for i = 1, tokens do
+                    redis.call('RPUSH', ARGV[1], 1)
+                end
+                redis.call('DECRBY', waiters, tokens)
+            end
+        end
+    end
+    return item
+end
+
+function queue_pop_many()
+    local count = tonumber(ARGV[3])
+    local items = {}
+    if ARGV[5] then
+        -- Reliable queues move each item into a processing list.
+        for i = 1, count do
+            local item = redis.call('RPOPLPUSH', KEYS[1], ARGV[5])
+            if not item then
+                break
+            end
+            table.insert(items, item)
+        end
+    elseif count > 0 then
+        items = redis.call('LRANGE', KEYS[1], 0, count - 1)
+        redis.call('LTRIM', KEYS[1], #items, -1)
+    end
+    -- A token is pushed for each producer registered as waiting for
+    -- space, up to the number of items taken.
+    if tonumber(ARGV[2]) > 0 then
+        local waiters = ARGV[1] .. '-waiters'
+        local tokens = math.min(#items + tonumber(ARGV[4]),
+                               tonumber(redis.call('GET', waiters) or 0))
+        if tokens > 0 then
+            for i = 1, tokens do
+                redis.call('RPUSH', ARGV[1], 1)
+            end
+            redis.call('DECRBY', waiters, tokens)
+        end
+    end
+    return items
+end
+
+function priority_queue_put()
+    local maxsize = tonumber(ARGV[1])
+    local count = (#ARGV - 4) / 2
+    if maxsize > 0 and redis.call('ZCARD', KEYS[1]) + count > maxsize then
+        if ARGV[4] ~= '' then
+            redis.call('INCR', ARGV[4] .. '-waiters')
+        end
+        return 0
+    end
+    -- Members are prefixed with a zero padded sequence number, so
+    -- that items with equal priorities are popped in FIFO order.
+    local sequence = redis.call('INCRBY', ARGV[3], count) - count
+    local args = {}
+    for i = 5, #ARGV, 2 do
+        sequence = sequence + 1
+        table.insert(args, ARGV[i])
+        table.insert(args, string.format('%020d:', sequence) .. ARGV[i + 1])
+        if #args == 1000 or i + 1 == #ARGV then
+            redis.call('ZADD', KEYS[1], unpack(args))
+            args = {}
+        end
+    end
+    if ARGV[2] ~= '' then
+        redis.call('HINCRBY', ARGV[2], 'unfinished', count)
+    end
+    return 1
+end
+
+function priority_queue_pop()
+    local count = tonumber(ARGV[3])
+    local items = {}
+    if count > 0 then
+        items = redis.call('ZPOPMIN', KEYS[1], count)
+    end
+    -- A token is pushed for each producer registered as waiting for
+    -- space, up to the number of items taken.
+    if tonumber(ARGV[2]) > 0 then
+        local waiters = ARGV[1] .. '-waiters'
+        local tokens = math.min(#items / 2 + tonumber(ARGV[4]),
+                               tonumber(redis.call('GET', waiters) or 0))
+        if tokens > 0 then
+            for i = 1, tokens do
+                redis.call('RPUSH', ARGV[1], 1)
+            end
+            redis.call('DECRBY', waiters, tokens)
+        end
+    end
+    return items
+end
+
+function delay_queue_put()
+    if redis.replicate_commands then
+        redis.replicate_commands()
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local due = now + tonumber(ARGV[2])
+    -- Wake a blocked consumer if these items are due before any
+    -- others, so that it can wait for the new time instead.
+    local first = redis.call('ZRANGE', ARGV[1], 0, 0, 'WITHSCORES')
+    if #first == 0 or due < tonumber(first[2]) then
+        redis.call('RPUSH', ARGV[4], 1)
+        redis.call('LTRIM', ARGV[4], 0, 0)
+    end
+    -- Members are prefixed with a zero padded sequence number, so
+    -- that they're unique, and items due at the same time are moved
+    -- in FIFO order.
+    local count = #ARGV - 5
+    local sequence = redis.call('INCRBY', ARGV[5], count) - count
+    local args = {}
+    for i = 6, #ARGV do
+        sequence = sequence + 1
+        table.insert(args, due)
+        table.insert(args, string.format('%020d:', sequence) .. ARGV[i])
+        if #args == 1000 or i == #ARGV then
+            redis.call('ZADD', ARGV[1], unpack(args))
+            args = {}
+        end
+    end
+    if ARGV[3] ~= '' then
+        redis.call('HINCRBY', ARGV[3], 'unfinished', count)
+    end
+    return due
+end
+
+function delay_queue_pop()
+    if redis.replicate_commands then
+        redis.replicate_commands()
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    -- Move due items onto the ready list, in batches of up to 1000
+    -- per call so that a large backlog doesn't block the server.
+    local due = redis.call('ZRANGEBYSCORE', ARGV[1], '-inf', now,
+                           'LIMIT', 0, 1000)
+    if #due > 0 then
+        local items = {}
+        for i, member in ipairs(due) do
+            items[i] = string.sub(member, string.find(member, ':') + 1)
+        end
+        redis.call('RPUSH', KEYS[1], unpack(items))
+        redis.call('ZREM', ARGV[1], unpack(due))
+    end
+    local wait = -1
+    if #due == 1000 then
+        wait = 0
+    else
+        local next = redis.call('ZRANGE', ARGV[1], 0, 0, 'WITHSCORES')
+        if #next > 0 then
+            wait = tonumber(next[2]) - now
+        end
+    end
+    local count = tonumber(ARGV[4])
+    local result = {wait}
+    if count > 0 then
+        local items = redis.call('LRANGE', KEYS[1], 0, count - 1)
+        redis.call('LTRIM', KEYS[1], #items, -1)
+        for _, item in ipairs(items) do
+            table.insert(result, item)
+        end
+    end
+    -- A token is pushed for each producer registered as waiting for
+    -- space, up to the number of items taken.
+    if tonumber(ARGV[3]) > 0 then
+        local waiters = ARGV[2] .. '-waiters'
+        local tokens = math.min(#result - 1 + tonumber(ARGV[5]),
+                               tonumber(redis.call('GET', waiters) or 0))
+        if tokens > 0 then
+            for i = 1, tokens do
+                redis.call('RPUSH', ARGV[2], 1)
+            end
+            redis.call('DECRBY', waiters, tokens)
+        end
+    end
+    return result
+end
+
+function set_queue_put()
+    local items = {}
+    local seen = {}
+    for i = 6, #ARGV do
+        if not seen[ARGV[i]] and
+                redis.call('SISMEMBER', ARGV[1], ARGV[i]) == 0 then
+            seen[ARGV[i]] = true
+            table.insert(items, ARGV[i])
+        end
+    end
+    if #items == 0 then
+        return 0
+    end
     local maxsize = tonumber(ARGV[2])
-    if size >= maxsize then
+    if maxsize > 0 and #items > maxsize then
+        return -2
+    elseif maxsize > 0 and redis.call('LLEN', KEYS[1]) + #items > maxsize then
+        if ARGV[5] ~= '' then
+            redis.call('INCR', ARGV[5] .. '-waiters')
+        end
+        return -1
+    end
+    for i = 1, #items, 1000 do
+        local last = math.min(i + 999, #items)
+        redis.call('SADD', ARGV[1], unpack(items, i, last))
+        redis.call(ARGV[3], KEYS[1], unpack(items, i, last))
+    end
+    if ARGV[4] ~= '' then
+        redis.call('HINCRBY', ARGV[4], 'unfinished', #items)
+    end
+    return #items
+end
+
+function set_queue_pop()
+    local count = tonumber(ARGV[4])
+    local items = {}
+    if count > 0 then
+        items = redis.call('LRANGE', KEYS[1], 0, count - 1)
+        redis.call('LTRIM', KEYS[1], #items, -1)
+    end
+    -- Any further args are items already taken with BLPOP.
+    for i = 5, #ARGV do
+        redis.call('SREM', ARGV[1], ARGV[i])
+    end
+    for _, item in ipairs(items) do
+        redis.call('SREM', ARGV[1], item)
+    end
+    -- A token is pushed for each producer registered as waiting for
+    -- space, up to the number of items taken.
+    if tonumber(ARGV[3]) > 0 then
+        local waiters = ARGV[2] .. '-waiters'
+        local tokens = math.min(#items + #ARGV - 4,
+                               tonumber(redis.call('GET', waiters) or 0))
+        if tokens > 0 then
+            for i = 1, tokens do
+                redis.call('RPUSH', ARGV[2], 1)
+            end
+            redis.call('DECRBY', waiters, tokens)
+        end
+    end
+    return items
+end
+
+function reliable_queue_nack()
+    if redis.call('LREM', ARGV[1], 1, ARGV[2]) == 0 then
         return 0
     end
-    redis.call('RPUSH', KEYS[1], ARGV[1])
+    redis.call('RPUSH', KEYS[1], ARGV[2])
     return 1
 end
 
-function multiset_intersection_update()
-    local keys_values = redis.call('HGETALL', KEYS[1])
-    local all = {}
-    for i = 1, #keys_values, 2 do
-        all[keys_values[i]] = keys_values[i+1]
+function reliable_queue_requeue()
+    local requeued = 0
+    local consumers = redis.call('SMEMBERS', ARGV[1])
+    for _, consumer in ipairs(consumers) do
+        if redis.call('EXISTS', ARGV[3] .. consumer) == 0 then
+            local processing = ARGV[2] .. consumer
+            local item = redis.call('LPOP', processing)
+            while item do
+                redis.call('RPUSH', KEYS[1], item)
+                requeued = requeued + 1
+                item = redis.call('LPOP', processing)
+            end
+            redis.call('SREM', ARGV[1], consumer)
+        end
+    end
+    return requeued
+end
+
+function queue_task_done()
+    local unfinished = tonumber(redis.call('HGET', ARGV[1], 'unfinished'))
+    if not unfinished or unfinished <= 0 then
+        return -1
+    end
+    unfinished = redis.call('HINCRBY', ARGV[1], 'unfinished', -1)
+    if unfinished == 0 then
+        local joiners = tonumber(redis.call('HGET', ARGV[1], 'joiners'))
+        if joiners then
+            for i = 1, joiners do
+                redis.call('RPUSH', ARGV[2], 1)
+            end
+            redis.call('HDEL', ARGV[1], 'joiners')
+        end
+    end
+    return unfinished
+end
+
+function queue_join()
+    local unfinished = tonumber(redis.call('HGET', ARGV[1], 'unfinished'))
+    if unfinished and unfinished > 0 then
+        redis.call('HINCRBY', ARGV[1], 'joiners', 1)
+        return unfinished
+    end
+    return 0
+end
+
+function lock_release()
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
     end
     redis.call('DEL', KEYS[1])
+    redis.call('RPUSH', ARGV[2], 1)
+    redis.call('LTRIM', ARGV[2], 0, 0)
+    redis.call('PEXPIRE', ARGV[2], ARGV[3])
+    return 1
+end
+
+function lock_renew()
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+
+function rwlock_acquire_read()
+    if redis.replicate_commands then
+        redis.replicate_commands()
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    redis.call('ZREMRANGEBYSCORE', ARGV[1], '-inf', now)
+    -- Wait while a writer holds the lock, or is waiting for it.
+    if redis.call('EXISTS', KEYS[1]) == 1 or
+            redis.call('EXISTS', ARGV[2]) == 1 then
+        local wait = math.max(redis.call('PTTL', KEYS[1]),
+                              redis.call('PTTL', ARGV[2]))
+        return math.max(wait, 1)
+    end
+    redis.call('ZADD', ARGV[1], now + tonumber(ARGV[4]), ARGV[3])
+    redis.call('PEXPIRE', ARGV[1], ARGV[4])
+    return 0
+end
+
+function rwlock_acquire_write()
+    if redis.replicate_commands then
+        redis.replicate_commands()
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    redis.call('ZREMRANGEBYSCORE', ARGV[1], '-inf', now)
+    local intent = redis.call('GET', ARGV[2])
+    if intent and intent ~= ARGV[3] then
+        return math.max(redis.call('PTTL', ARGV[2]), 1)
+    end
+    -- Registering the intent to write stops new readers, so that
+    -- writers aren't starved by a steady stream of readers.
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('SET', ARGV[2], ARGV[3], 'PX', ARGV[4])
+        return math.max(redis.call('PTTL', KEYS[1]), 1)
+    end
+    local last = redis.call('ZRANGE', ARGV[1], -1, -1, 'WITHSCORES')
+    if #last > 0 then
+        redis.call('SET', ARGV[2], ARGV[3], 'PX', ARGV[4])
+        return math.max(tonumber(last[2]) - now, 1)
+    end
+    redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[4])
+    if intent then
+        redis.call('DEL', ARGV[2])
+    end
+    return 0
+end
+
+function rwlock_release_read()
+    if redis.call('ZREM', ARGV[1], ARGV[3]) == 0 then
+        return 0
+    end
+    if redis.call('ZCARD', ARGV[1]) == 0 then
+        redis.call('PUBLISH', ARGV[4], 1)
+    end
+    return 1
+end
+
+function rwlock_release_write()
+    local released = 0
+    if redis.call('GET', KEYS[1]) == ARGV[3] then
+        redis.call('DEL', KEYS[1])
+        released = 1
+    end
+    if redis.call('GET', ARGV[2]) == ARGV[3] then
+        redis.call('DEL', ARGV[2])
+    end
+    redis.call('PUBLISH', ARGV[4], 1)
+    return released
+end
+
+function condition_notify()
+    -- Moves up to ARGV[1] waiting tokens (all when negative) onto
+    -- each waiter's own list, which the waiter is blocked on.
+    local n = tonumber(ARGV[1])
+    local notified = 0
+    while n < 0 or notified < n do
+        local token = redis.call('LPOP', KEYS[1])
+        if not token then
+            break
+        end
+        redis.call('RPUSH', KEYS[1] .. '-notify-' .. token, 1)
+        notified = notified + 1
+    end
+    return notified
+end
+
+function barrier_wait()
+    if redis.call('HEXISTS', KEYS[1], 'broken') == 1 then
+        return {-1, ''}
+    end
+    local generation = redis.call('HGET', KEYS[1], 'generation') or '0'
+    local count = redis.call('HINCRBY', KEYS[1], 'count', 1)
+    if count >= tonumber(ARGV[1]) then
+        -- The last party to arrive starts the next generation, and
+        -- releases the others once it's run the action.
+        redis.call('HSET', KEYS[1], 'count', 0)
+        redis.call('HINCRBY', KEYS[1], 'generation', 1)
+    end
+    return {count - 1, generation}
+end
+
+function barrier_break()
+    local generation = redis.call('HGET', KEYS[1], 'generation') or '0'
+    local count = tonumber(redis.call('HGET', KEYS[1], 'count') or 0)
+    if ARGV[2] ~= '' then
+        -- Called by a party that timed out, which has already been
+        -- released if its generation has ended.
+        if ARGV[2] ~= generation then
+            return 0
+        end
+        count = count - 1
+    end
+    for i = 1, count do
+        redis.call('RPUSH', KEYS[1] .. '-release-' .. generation, 0)
+    end
+    redis.call('HSET', KEYS[1], 'count', 0)
+    if ARGV[1] == '1' then
+        redis.call('HDEL', KEYS[1], 'broken')
+        redis.call('HINCRBY', KEYS[1], 'generation', 1)
+    else
+        redis.call('HSET', KEYS[1], 'broken', 1)
+    end
+    return 1
+end
+
+function queue_cancel_wait()
+    -- A producer that stops waiting for space takes the token pushed
+    -- for it if there is one, otherwise it unregisters.
+    if not redis.call('LPOP', ARGV[1]) then
+        local waiters = ARGV[1] .. '-waiters'
+        if tonumber(redis.call('GET', waiters) or 0) > 0 then
+            redis.call('DECR', waiters)
+        end
+    end
+end
+
+function multiset_intersection_update()
+    -- Fields given with positive counts, which are the only ones kept.
+    local counts = {}
+    local fields = {}
     for i = 1, #ARGV, 2 do
-        local current = tonumber(all[ARGV[i]])
         local new = tonumber(ARGV[i+1])
-        if new > 0 and current then
-            redis.call('HSET', KEYS[1], ARGV[i], math.min(new, current))
+        if new > 0 then
+            if not counts[ARGV[i]] then
+                table.insert(fields, ARGV[i])
+            end
+            counts[ARGV[i]] = new
         end
     end
+    -- Read the current counts in chunks, to stay within the limit
+    -- on the number of args unpack can provide, and collect the
+    -- fields whose counts are lowered, or removed as they aren't
+    -- positive, as per Counter.
+    local chunk_size = 1000
+    local kept = 0
+    local winners = {}
+    local losers = {}
+    for i = 1, #fields, chunk_size do
+        local chunk = {unpack(fields, i,
+                              math.min(i + chunk_size - 1, #fields))}
+        local current = redis.call('HMGET', KEYS[1], unpack(chunk))
+        for j, field in ipairs(chunk) do
+            local value = tonumber(current[j])
+            if value and value <= 0 then
+                table.insert(losers, field)
+            elseif value then
+                kept = kept + 1
+                if counts[field] < value then
+                    table.insert(winners, field)
+                    table.insert(winners, counts[field])
+                end
+            end
+        end
+    end
+    -- Only the fields removed are deleted, rather than rebuilding
+    -- the hash, and the field names are only read when some of
+    -- them weren't given.
+    if redis.call('HLEN', KEYS[1]) > kept + #losers then
+        for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+            if not counts[field] then
+                table.insert(losers, field)
+            end
+        end
+    end
+    for i = 1, #losers, chunk_size do
+        redis.call('HDEL', KEYS[1], unpack(losers, i,
+                   math.min(i + chunk_size - 1, #losers)))
+    end
+    for i = 1, #winners, chunk_size do
+        redis.call('HSET', KEYS[1], unpack(winners, i,
+                   math.min(i + chunk_size - 1, #winners)))
+    end
 end
 
 function multiset_union_update()
+    local counts = {}
+    local fields = {}
     for i = 1, #ARGV, 2 do
-        local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
         local new = tonumber(ARGV[i+1])
-        if new > 0 and (not current or new > current) then
-            redis.call('HSET', KEYS[1], ARGV[i], new)
+        if new > 0 then
+            if not counts[ARGV[i]] then
+                table.insert(fields, ARGV[i])
+            end
+            counts[ARGV[i]] = new
+        end
+    end
+    local chunk_size = 1000
+    local existing = 0
+    local winners = {}
+    local losers = {}
+    for i = 1, #fields, chunk_size do
+        local chunk = {unpack(fields, i,
+                              math.min(i + chunk_size - 1, #fields))}
+        local current = redis.call('HMGET', KEYS[1], unpack(chunk))
+        for j, field in ipairs(chunk) do
+            local value = tonumber(current[j])
+            if value then
+                existing = existing + 1
+            end
+            if not value or counts[field] > value then
+                table.insert(winners, field)
+                table.insert(winners, counts[field])
+            end
         end
     end
+    -- Fields that weren't given are kept, unless their counts aren't
+    -- positive, as per Counter, so they're only read when there are
+    -- some.
+    if redis.call('HLEN', KEYS[1]) > existing then
+        local all = redis.call('HGETALL', KEYS[1])
+        for i = 1, #all, 2 do
+            if not counts[all[i]] and tonumber(all[i+1]) <= 0 then
+                table.insert(losers, all[i])
+            end
+        end
+    end
+    for i = 1, #losers, chunk_size do
+        redis.call('HDEL', KEYS[1], unpack(losers, i,
+                   math.min(i + chunk_size - 1, #losers)))
+    end
+    for i = 1, #winners, chunk_size do
+        redis.call('HSET', KEYS[1], unpack(winners, i,
+                   math.min(i + chunk_size - 1, #winners)))
+    end
 end
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 
+import array
 import collections
 import os
+import threading
 import time
 import unittest
 import hot_redis
@@ -584,6 +586,79 @@ class StringTests(BaseTestCase):
             d[0] = b
         self.assertRaises(TypeError, immutable_set)
 
+    @unittest.skipIf(TEST_NO_LUA, "No Lua")
+    def test_immutable_release(self):
+        client = hot_redis.default_client()
+        a = hot_redis.ImmutableString("wagwaan")
+        key = a.key
+        for i in range(10):
+            a += "hot"
+        self.assertEqual(a, "wagwaan" + "hot" * 10)
+        self.assertFalse(client.exists(key))
+        b = hot_redis.ImmutableString(key=a.key)
+        a *= 2
+        self.assertEqual(b, "wagwaan" + "hot" * 10)
+        self.assertEqual(a, ("wagwaan" + "hot" * 10) * 2)
+        c = hot_redis.ImmutableString("skull", key="flute")
+        c += "don"
+        self.assertEqual(c, "skulldon")
+        self.assertTrue(client.exists("flute"))
+        references = dict(hot_redis.ImmutableString._references)
+        with self.assertRaises(Exception):
+            a *= "hot"
+        self.assertEqual(hot_redis.ImmutableString._references, references)
+        client.delete(a.key, b.key, c.key)
+
+    def test_iter(self):
+        a = u"wagwaan h\xf6tskull " * 100
+        b = hot_redis.String(a)
+        b.chunk_size = 7
+        self.assertEqual(list(b), list(a))
+        c = hot_redis.String()
+        c.setrange(0, b"ab\xffcd")
+        c.chunk_size = 3
+        self.assertEqual(list(c), list(c.value))
+
+    def test_chunks(self):
+        a = "wagwaan hotskull"
+        b = hot_redis.String(a)
+        self.assertEqual(list(b.iter_chunks(5)),
+                         [b"wagwa", b"an ho", b"tskul", b"l"])
+        self.assertEqual(b"".join(b.iter_chunks(4)), a.encode("utf-8"))
+
+    def test_readinto(self):
+        a = "wagwaan hotskull"
+        b = hot_redis.String(a)
+        b.chunk_size = 3
+        c = bytearray(10)
+        self.assertEqual(b.readinto(c), 10)
+        self.assertEqual(c, bytearray(b"wagwaan ho"))
+        self.assertEqual(b.readinto(c, offset=8), 8)
+        self.assertEqual(c[:8], bytearray(b"hotskull"))
+        d = array.array("i", [0] * 2)
+        self.assertEqual(b.readinto(d), 8)
+        self.assertEqual(d.tobytes(), b"wagwaan ")
+
+    def test_open(self):
+        a = b"\x00\xffwagwaan" * 1000
+        b = hot_redis.String()
+        with b.open("wb", buffer_size=100) as f:
+            for i in range(0, len(a), 64):
+                f.write(a[i:i + 64])
+        self.assertEqual(len(b), len(a))
+        with b.open("ab") as f:
+            f.write(b"hotskull")
+        with b.open("rb", buffer_size=100) as f:
+            self.assertEqual(f.read(10), a[:10])
+            f.seek(-8, 2)
+            self.assertEqual(f.read(), b"hotskull")
+            f.seek(0)
+            self.assertEqual(f.read(), a + b"hotskull")
+            self.assertRaises(ValueError, f.seek, -1, 0)
+            self.assertRaises(ValueError, f.seek, -len(b) - 1, 2)
+        c = hot_redis.ImmutableString()
+        self.assertRaises(TypeError, lambda: c.open("wb"))
+
 
 class IntTests(BaseTestCase):
 
@@ -832,6 +907,146 @@ class FloatTests(BaseTestCase):
         self.assertAlmostEqual(b ** c, f)
 
 
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class ShardedIntTests(BaseTestCase):
+
+    def test_value(self):
+        a = 420
+        self.assertEqual(a, hot_redis.ShardedInt(a))
+        b = hot_redis.ShardedInt(a, shards=4)
+        c = hot_redis.ShardedInt(9000, key=b.key, shards=4)
+        self.assertEqual(b, 9000)
+        self.assertEqual(c, 9000)
+
+    def test_empty(self):
+        self.assertEqual(hot_redis.ShardedInt(), 0)
+
+    def test_add(self):
+        client = hot_redis.default_client()
+        a = hot_redis.ShardedInt(shards=4)
+        for i in range(100):
+            a += 1
+        a -= 10
+        self.assertEqual(a, 90)
+        self.assertEqual(a + 10, 100)
+        self.assertEqual(10 + a, 100)
+        shards = [int(v or 0) for v in client.mget(a.shard_keys)]
+        self.assertEqual(sum(shards), 90)
+        self.assertGreater(len([v for v in shards if v]), 1)
+        a.delete()
+
+    def test_ops(self):
+        a = hot_redis.ShardedInt(shards=4)
+        for i in range(10):
+            a += 1
+        a *= 3
+        self.assertEqual(a, 30)
+        a //= 4
+        self.assertEqual(a, 7)
+        a %= 4
+        self.assertEqual(a, 3)
+        a **= 2
+        self.assertEqual(a, 9)
+        a.delete()
+
+    def test_cache(self):
+        a = hot_redis.ShardedInt(1, cache=60)
+        b = hot_redis.ShardedInt(key=a.key)
+        self.assertEqual(a, 1)
+        b += 1
+        a += 1
+        self.assertEqual(a, 2)
+        self.assertEqual(b, 3)
+        b.delete()
+
+
+class BufferedCounterTests(BaseTestCase):
+
+    def test_int(self):
+        a = hot_redis.BufferedInt(420, flush_interval=60)
+        b = hot_redis.Int(key=a.key)
+        for i in range(100):
+            a += 1
+        a -= 10
+        self.assertEqual(a, 510)
+        self.assertEqual(b, 420)
+        a.flush()
+        self.assertEqual(b, 510)
+        self.assertEqual(a, 510)
+
+    def test_float(self):
+        a = hot_redis.BufferedFloat(flush_interval=60)
+        b = hot_redis.Float(key=a.key)
+        a += 1.5
+        a -= .25
+        self.assertAlmostEqual(a, 1.25)
+        self.assertEqual(b, 0)
+        hot_redis.flush_counters()
+        self.assertAlmostEqual(b, 1.25)
+
+    def test_flush_count(self):
+        a = hot_redis.BufferedInt(flush_count=10, flush_interval=60)
+        b = hot_redis.Int(key=a.key)
+        for i in range(9):
+            a += 1
+        self.assertEqual(b, 0)
+        a += 1
+        self.assertEqual(b, 10)
+        c = hot_redis.BufferedInt(flush_count=10, flush_interval=60)
+        d = hot_redis.Int(key=c.key)
+        for i in range(5):
+            c += 1
+            a += 1
+        a.flush()
+        for i in range(5):
+            a += 1
+        self.assertEqual(d, 0)
+        self.assertEqual(c, 5)
+        for i in range(4):
+            c += 1
+        self.assertEqual(d, 0)
+        c += 1
+        self.assertEqual(d, 10)
+        self.assertEqual(b, 15)
+        self.assertEqual(a, 20)
+
+    def test_flush_error(self):
+        client = hot_redis.HotClient()
+        pipeline = client.pipeline
+
+        def fail(*args):
+            client.pipeline = pipeline
+            raise hot_redis.types.redis.exceptions.ConnectionError
+
+        a = hot_redis.BufferedInt(flush_interval=.1, client=client)
+        b = hot_redis.Int(key=a.key)
+        a += 1
+        client.pipeline = fail
+        self.assertRaises(Exception, hot_redis.flush_counters)
+        self.assertEqual(a, 1)
+        self.assertEqual(b, 0)
+        time.sleep(.5)
+        self.assertEqual(b, 1)
+
+    def test_flush_interval(self):
+        a = hot_redis.BufferedInt(flush_interval=.1)
+        b = hot_redis.Int(key=a.key)
+        a += 1
+        time.sleep(.5)
+        self.assertEqual(b, 1)
+
+    @unittest.skipIf(TEST_NO_LUA, "No Lua")
+    def test_ops(self):
+        a = hot_redis.BufferedInt(2, flush_interval=60)
+        a += 1
+        a *= 3
+        self.assertEqual(a, 9)
+        a.value = 1
+        self.assertEqual(a, 1)
+        a.flush()
+        self.assertEqual(a, 1)
+
+
 @unittest.skipIf(TEST_NO_LUA, "No Lua")
 class QueueTests(BaseTestCase):
 
@@ -871,6 +1086,70 @@ class QueueTests(BaseTestCase):
             pass
         self.assertTrue(time.time() - start >= timeout)
 
+    def test_put_wakeup(self):
+        q = hot_redis.Queue(maxsize=1)
+        q.put("wagwaan")
+        threading.Timer(.2, q.get).start()
+        start = time.time()
+        q.put("hotskull", timeout=5)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(q.get_nowait(), "hotskull")
+        q.put("popcaan")
+        start = time.time()
+        self.assertRaises(hot_redis.queue.Full,
+                          lambda: q.put("popcaan", timeout=.25))
+        self.assertTrue(time.time() - start >= .25)
+        q.delete()
+
+    def test_space_tokens(self):
+        client = hot_redis.default_client()
+        q = hot_redis.Queue(maxsize=200)
+        q.put_many(range(200))
+        q.get_many(100)
+        for i in range(100):
+            q.get()
+        # Tokens are only pushed for waiting producers.
+        self.assertEqual(client.llen(q.space_key), 0)
+        q.put_many(range(200))
+        calls = []
+        queue_put = q.queue_put
+        q.queue_put = lambda *args: calls.append(1) or queue_put(*args)
+        self.assertRaises(hot_redis.queue.Full, q.put, 1, timeout=.2)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(client.llen(q.space_key), 0)
+        self.assertEqual(int(client.get(q.waiters_key) or 0), 0)
+        s = hot_redis.BoundedSemaphore(value=50)
+        for i in range(50):
+            s.acquire()
+            s.release()
+            s.acquire()
+        self.assertEqual(client.llen(s.space_key), 0)
+        q.delete()
+        s.delete()
+
+    def test_space_without_token(self):
+        client = hot_redis.default_client()
+        q = hot_redis.Queue(maxsize=1)
+        q.space_poll_interval = .1
+        q.put("wagwaan")
+        t = threading.Thread(target=q.put, args=("hot",))
+        t.start()
+        time.sleep(.2)
+        # Removed without pushing a space token.
+        client.lpop(q.key)
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(q.get(block=False), "hot")
+        self.assertEqual(int(client.get(q.waiters_key) or 0), 0)
+        q.delete()
+
+    def test_get_nowait(self):
+        q = hot_redis.Queue()
+        q.put("wagwaan")
+        q.put("hotskull")
+        self.assertEqual(q.get_nowait(), "wagwaan")
+        self.assertEqual(q.get_nowait(), "hotskull")
+
     def test_empty(self):
         q = hot_redis.Queue()
         self.assertTrue(q.empty())
@@ -909,6 +1188,75 @@ class QueueTests(BaseTestCase):
         self.assertNotIn(b, q)
         self.assertEqual(a, q.get())
         self.assertNotIn(a, q)
+        q.append(a)
+        q.append(b)
+        self.assertEqual(b, q.get())
+
+    def test_join(self):
+        q = hot_redis.Queue()
+        q.join()
+        for item in ("wagwaan", "hot", "skull"):
+            q.put(item)
+        self.assertEqual(q.unfinished_tasks, 3)
+
+        def consume():
+            while True:
+                try:
+                    q.get(timeout=1)
+                except hot_redis.queue.Empty:
+                    break
+                time.sleep(.05)
+                q.task_done()
+
+        threading.Thread(target=consume).start()
+        q.join()
+        self.assertEqual(q.unfinished_tasks, 0)
+        self.assertTrue(q.empty())
+        self.assertRaises(ValueError, q.task_done)
+        q.delete()
+
+    def test_put_get_many(self):
+        a = ["wagwaan", "hot", "skull"]
+        q = hot_redis.Queue()
+        q.put_many(a)
+        q.put_many([])
+        self.assertEqual(q.unfinished_tasks, 3)
+        self.assertEqual(q.get_many(2), a[:2])
+        self.assertEqual(q.get_many(10), a[2:])
+        self.assertRaises(hot_redis.queue.Empty,
+                          lambda: q.get_many(10, block=False))
+        self.assertRaises(hot_redis.queue.Empty,
+                          lambda: q.get_many(10, timeout=.1))
+        threading.Timer(.2, lambda: q.put_many(a)).start()
+        self.assertEqual(q.get_many(10, timeout=5), a)
+        q.delete()
+        for queue_type in (hot_redis.Queue, hot_redis.SetQueue,
+                           hot_redis.PriorityQueue, hot_redis.DelayQueue,
+                           hot_redis.ReliableQueue, hot_redis.StreamQueue):
+            q = queue_type()
+            self.assertRaises(ValueError, lambda: q.get_many(0, timeout=1))
+            q.delete()
+
+    def test_put_many_maxsize(self):
+        a = ["wagwaan", "hot", "skull"]
+        q = hot_redis.Queue(maxsize=4)
+        q.put_many(a)
+        self.assertRaises(ValueError, lambda: q.put_many(a * 2))
+        self.assertRaises(hot_redis.queue.Full,
+                          lambda: q.put_many(a, block=False))
+        self.assertEqual(q.qsize(), 3)
+        threading.Timer(.2, lambda: q.get_many(2)).start()
+        q.put_many(a[:2], timeout=5)
+        self.assertEqual(q.get_many(10), a[2:] + a[:2])
+        q.delete()
+
+    def test_lifo_queue_maxsize(self):
+        q = hot_redis.LifoQueue(maxsize=2)
+        q.put("wagwaan")
+        q.put("hotskull")
+        self.assertEqual(q.get(), "hotskull")
+        self.assertEqual(q.unfinished_tasks, 2)
+        q.delete()
 
     def test_set_queue(self):
         a = "wagwaan"
@@ -919,6 +1267,347 @@ class QueueTests(BaseTestCase):
         self.assertEqual(q.qsize(), 1)
         self.assertEqual(q.get(), a)
         self.assertEqual(q.qsize(), 0)
+        q.put_many(["hot", "skull", "hot"])
+        self.assertEqual(q.unfinished_tasks, 3)
+        self.assertEqual(q.set, set(["hot", "skull"]))
+        self.assertEqual(q.get_many(10), ["hot", "skull"])
+        self.assertEqual(q.set, set())
+        threading.Timer(.2, lambda: q.put(a)).start()
+        self.assertEqual(q.get(timeout=5), a)
+        self.assertEqual(q.set, set())
+        q.put(a)
+        q.delete()
+        self.assertEqual(q.set, set())
+        self.assertEqual(q.qsize(), 0)
+
+    def test_lifo_set_queue(self):
+        q = hot_redis.LifoSetQueue(maxsize=2)
+        q.put_many(["wagwaan", "hot", "wagwaan"])
+        self.assertRaises(hot_redis.queue.Full,
+                          lambda: q.put("skull", block=False))
+        q.put("hot", block=False)
+        self.assertEqual(q.get(), "hot")
+        q.put("skull")
+        self.assertEqual(q.get_many(10), ["skull", "wagwaan"])
+        q.put("wagwaan")
+        q.append("wagwaan")
+        q.append("wagwaan")
+        self.assertEqual(q.qsize(), 1)
+        q.delete()
+
+
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class PriorityQueueTests(BaseTestCase):
+
+    def test_get(self):
+        q = hot_redis.PriorityQueue()
+        q.put((2, "wagwaan"))
+        q.put_many([(1, "hot"), (2, "skull"), (.5, "popcaan")])
+        self.assertEqual(len(q), 4)
+        self.assertEqual(q.get(), (.5, "popcaan"))
+        self.assertEqual(q.get_many(2), [(1, "hot"), (2, "wagwaan")])
+        self.assertEqual(q.get(), (2, "skull"))
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(block=False))
+        start = time.time()
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(timeout=.25))
+        self.assertTrue(time.time() - start >= .25)
+        threading.Timer(.2, lambda: q.put((3, "wagwaan"))).start()
+        self.assertEqual(q.get(timeout=5), (3, "wagwaan"))
+        q.delete()
+
+    def test_maxsize(self):
+        q = hot_redis.PriorityQueue(maxsize=2)
+        q.put_many([(2, "wagwaan"), (1, "hot")])
+        self.assertTrue(q.full())
+        self.assertRaises(hot_redis.queue.Full,
+                          lambda: q.put((0, "skull"), block=False))
+        threading.Timer(.2, q.get).start()
+        q.put((0, "skull"), timeout=5)
+        self.assertEqual(q.value, [(0, "skull"), (2, "wagwaan")])
+        q.delete()
+
+    def test_initial(self):
+        a = [(2, "wagwaan"), (1, "hot")]
+        q = hot_redis.PriorityQueue(initial=a)
+        r = hot_redis.PriorityQueue(initial=a, key=q.key)
+        self.assertEqual(r.value, sorted(a))
+        self.assertEqual(r.unfinished_tasks, 2)
+        r.delete()
+
+
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class DelayQueueTests(BaseTestCase):
+
+    def test_delay(self):
+        q = hot_redis.DelayQueue()
+        start = time.time()
+        q.put("wagwaan", delay=.3)
+        q.put_many(["hot", "skull"], delay=.1)
+        q.put("popcaan")
+        self.assertEqual(q.delayed_size(), 3)
+        self.assertEqual(q.unfinished_tasks, 4)
+        self.assertEqual(q.get_many(10), ["popcaan"])
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(block=False))
+        self.assertEqual(q.get_many(10, timeout=5), ["hot", "skull"])
+        self.assertEqual(q.get(timeout=5), "wagwaan")
+        self.assertTrue(.3 <= time.time() - start < 1)
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(timeout=.1))
+        q.delete()
+
+    def test_wakeup(self):
+        q = hot_redis.DelayQueue()
+        q.put("wagwaan", delay=10)
+        put = lambda: q.put("hotskull", delay=.1)
+        threading.Timer(.1, put).start()
+        start = time.time()
+        self.assertEqual(q.get(timeout=5), "hotskull")
+        self.assertTrue(time.time() - start < 1)
+        q.delete()
+
+
+class StreamQueueTests(BaseTestCase):
+
+    def test_get(self):
+        a = ["wagwaan", "hot", "skull"]
+        q = hot_redis.StreamQueue()
+        q.put("wagwaan")
+        q.put_many(a[1:])
+        self.assertEqual(q.value, a)
+        self.assertEqual(q.get(), "wagwaan")
+        self.assertEqual(q.get_many(10, block=False), a[1:])
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(block=False))
+        self.assertRaises(hot_redis.queue.Empty, lambda: q.get(timeout=.1))
+        self.assertEqual(q.info()["pending"], 3)
+        for _ in a:
+            q.task_done()
+        self.assertRaises(ValueError, q.task_done)
+        info = q.info()
+        self.assertEqual(info["length"], 3)
+        self.assertEqual(info["pending"], 0)
+
+    def test_consumers(self):
+        a = hot_redis.StreamQueue()
+        b = hot_redis.StreamQueue(key=a.key, claim_idle=.1)
+        a.put_many(["wagwaan", "hot", "skull"])
+        entries = a.get_entries(2)
+        self.assertEqual([item for _, item in entries], ["wagwaan", "hot"])
+        self.assertEqual(b.get_many(10), ["skull"])
+        self.assertEqual(a.ack(entries[0][0]), 1)
+        time.sleep(.2)
+        self.assertEqual(b.get_many(10), ["hot", "skull"])
+        self.assertEqual(b.info()["consumers"], 2)
+
+    def test_size(self):
+        q = hot_redis.StreamQueue()
+        self.assertTrue(q.empty())
+        q.put_many(["wagwaan", "hot"])
+        self.assertEqual(q.qsize(), 2)
+        self.assertFalse(q.full())
+        self.assertEqual(q.get(), "wagwaan")
+        self.assertEqual(q.qsize(), 1)
+        info = dict(q.info(), lag=None)
+        self.assertEqual(q._undelivered(info), 1)
+        q.join_poll_interval = .05
+        done = []
+        t = threading.Thread(target=lambda: done.append(q.join()))
+        t.start()
+        self.assertEqual(q.get(), "hot")
+        self.assertTrue(q.empty())
+        q.task_done()
+        time.sleep(.2)
+        self.assertEqual(done, [])
+        q.task_done()
+        t.join(1)
+        self.assertEqual(done, [None])
+        q.delete()
+
+    def test_maxlen(self):
+        q = hot_redis.StreamQueue(maxlen=10)
+        q.put_many(range(1000))
+        self.assertTrue(len(q) < 1000)
+        q.delete()
+        q.put("wagwaan")
+        self.assertEqual(q.get(), "wagwaan")
+
+
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class WorkerTests(BaseTestCase):
+
+    def handle(self, item):
+        with self.lock:
+            self.handled.append(item)
+        if item == "skull":
+            raise ValueError
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.handled = []
+
+    def test_queue(self):
+        a = list(map(str, range(100)))
+        q = hot_redis.Queue()
+        q.put_many(a)
+        worker = hot_redis.Worker(q, self.handle, concurrency=4,
+                                  prefetch=10, poll_interval=.1)
+        with worker:
+            q.join()
+        self.assertItemsEqual(self.handled, a)
+        self.assertEqual(worker.stats["processed"], 100)
+        self.assertTrue(worker.throughput > 0)
+        self.assertTrue(worker.latency >= 0)
+        q.delete()
+
+    def test_reliable_queue(self):
+        q = hot_redis.ReliableQueue()
+        q.put_many(["wagwaan", "hot"])
+        worker = hot_redis.Worker(q, self.handle, poll_interval=.1)
+        with worker:
+            q.join()
+        self.assertEqual(q.processing, [])
+        self.assertEqual(worker.stats["failed"], 0)
+        q.delete()
+
+    def test_reliable_queue_requeue(self):
+        a = hot_redis.ReliableQueue(visibility_timeout=.1)
+        a.put("wagwaan")
+        a.get()
+        q = hot_redis.ReliableQueue(key=a.key, visibility_timeout=.1)
+        with hot_redis.Worker(q, self.handle, poll_interval=.1):
+            q.join()
+        self.assertEqual(self.handled, ["wagwaan"])
+        q.delete()
+
+    def test_stream_queue(self):
+        q = hot_redis.StreamQueue()
+        q.put_many(["wagwaan", "hot", "skull"])
+        worker = hot_redis.Worker(q, self.handle, concurrency=2,
+                                  poll_interval=.1).start()
+        while len(self.handled) < 3:
+            time.sleep(.05)
+        worker.stop()
+        self.assertEqual(worker.stats["failed"], 1)
+        self.assertEqual(q.info()["pending"], 1)
+        self.assertEqual(worker.failures, {})
+        self.assertEqual(len(q.delivered), 0)
+        q.delete()
+
+    def test_stream_queue_retries(self):
+        q = hot_redis.StreamQueue(claim_idle=.1)
+        q.put_many(["wagwaan", "skull"])
+        worker = hot_redis.Worker(q, self.handle, poll_interval=.1,
+                                  max_retries=2).start()
+        while self.handled.count("skull") < 3 or q.info()["pending"]:
+            time.sleep(.05)
+        worker.stop()
+        self.assertEqual(self.handled.count("wagwaan"), 1)
+        self.assertEqual(worker.stats["failed"], 3)
+        self.assertEqual(worker.failures, {})
+        self.assertEqual(len(q.delivered), 0)
+        q.delete()
+
+    def test_retries(self):
+        q = hot_redis.ReliableQueue()
+        q.put_many(["wagwaan", "skull"])
+        worker = hot_redis.Worker(q, self.handle, poll_interval=.1,
+                                  max_retries=2, retry_delay=.05)
+        with worker:
+            q.join()
+        self.assertEqual(self.handled.count("wagwaan"), 1)
+        self.assertEqual(self.handled.count("skull"), 3)
+        self.assertEqual(worker.stats["failed"], 3)
+        self.assertEqual(worker.failures, {})
+        self.assertEqual(q.processing, [])
+        q.delete()
+
+    def test_failures_pruned(self):
+        q = hot_redis.ReliableQueue()
+        q.put_many(["wagwaan", "hot"])
+        seen = set()
+
+        def handle(item):
+            with self.lock:
+                if item not in seen:
+                    seen.add(item)
+                    raise ValueError
+
+        worker = hot_redis.Worker(q, handle, poll_interval=.1,
+                                  retry_delay=.05)
+        with worker:
+            q.join()
+        self.assertEqual(worker.stats["processed"], 2)
+        self.assertEqual(worker.failures, {})
+        worker.max_tracked_failures = 1
+        for item in ("wagwaan", "hot"):
+            worker.retry(None, item)
+        self.assertEqual(list(worker.failures), ["hot"])
+        worker.join()
+        q.delete()
+
+    def test_retry_on_stop(self):
+        q = hot_redis.ReliableQueue()
+        q.put("skull")
+        worker = hot_redis.Worker(q, self.handle, poll_interval=.1,
+                                  retry_delay=60).start()
+        while not worker.retrying:
+            time.sleep(.05)
+        worker.stop()
+        self.assertEqual(worker.retrying, {})
+        self.assertEqual(q.processing, [])
+        self.assertEqual(q.qsize(), 1)
+        q.delete()
+
+
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class ReliableQueueTests(BaseTestCase):
+
+    def test_ack(self):
+        a = ["wagwaan", "hot", "skull"]
+        q = hot_redis.ReliableQueue()
+        q.put_many(a)
+        self.assertEqual(q.get(), "wagwaan")
+        self.assertEqual(q.get_many(10), ["hot", "skull"])
+        self.assertItemsEqual(q.processing, a)
+        self.assertTrue(q.ack("hot"))
+        self.assertFalse(q.ack("hot"))
+        self.assertItemsEqual(q.processing, ["wagwaan", "skull"])
+        self.assertRaises(hot_redis.queue.Empty,
+                          lambda: q.get(timeout=.1))
+        q.delete()
+
+    def test_nack(self):
+        q = hot_redis.ReliableQueue()
+        q.put_many(["wagwaan", "hot"])
+        self.assertEqual(q.get(), "wagwaan")
+        self.assertTrue(q.nack("wagwaan"))
+        self.assertFalse(q.nack("wagwaan"))
+        self.assertEqual(q.processing, [])
+        self.assertEqual(q.get_many(10), ["wagwaan", "hot"])
+        q.delete()
+
+    def test_requeue_expired(self):
+        a = hot_redis.ReliableQueue(visibility_timeout=.1)
+        b = hot_redis.ReliableQueue(key=a.key, visibility_timeout=.1)
+        a.put_many(["wagwaan", "hot", "skull"])
+        self.assertEqual(a.get_many(2), ["wagwaan", "hot"])
+        self.assertEqual(b.requeue_expired(), 0)
+        time.sleep(.2)
+        b.touch()
+        self.assertEqual(b.requeue_expired(), 2)
+        self.assertEqual(a.processing, [])
+        self.assertEqual(b.get_many(10), ["wagwaan", "hot", "skull"])
+        a.delete()
+
+    def test_requeue_on_get(self):
+        a = hot_redis.ReliableQueue(visibility_timeout=.1)
+        b = hot_redis.ReliableQueue(key=a.key, visibility_timeout=.1)
+        a.put_many(["wagwaan", "hot"])
+        self.assertEqual(a.get_many(2), ["wagwaan", "hot"])
+        # a dies without acking, and b is blocked until a's lease
+        # expires and b requeues its items.
+        self.assertEqual(b.get(timeout=2), "wagwaan")
+        self.assertEqual(a.processing, [])
+        self.assertEqual(b.get(block=False), "hot")
+        a.delete()
 
 
 @unittest.skipIf(TEST_NO_LUA, "No Lua")
@@ -993,6 +1682,21 @@ class CounterTests(BaseTestCase):
         d.update(**b)
         self.assertEqual(d, c)
 
+    def test_update_many(self):
+        words = ["word%s" % (i % 5000) for i in range(20000)]
+        c = collections.Counter(words)
+        d = hot_redis.MultiSet()
+        d.update(words)
+        self.assertEqual(d, c)
+        c.subtract(words[:10000])
+        d.subtract(words[:10000])
+        self.assertEqual(d, c)
+        d.subtract(hot_redis.MultiSet(key=d.key))
+        self.assertEqual(sum(d.values()), 0)
+        d.chunk_size = 7
+        d.update(words)
+        self.assertEqual(d, collections.Counter(words))
+
     def test_subtract(self):
         a = "wagwaan"
         b = {"hotskull": 420}
@@ -1050,6 +1754,26 @@ class CounterTests(BaseTestCase):
         d |= collections.Counter(b)
         self.assertEqual(d, c)
 
+    def test_intersection_union_many(self):
+        # More fields than the atoms read or write in a single chunk.
+        a = collections.Counter(dict([("k%s" % i, i % 7)
+                                      for i in range(2500)]))
+        b = collections.Counter(dict([("k%s" % i, i % 5)
+                                      for i in range(1200, 3700)]))
+        for op in ("__iand__", "__ior__"):
+            c = collections.Counter(a)
+            d = hot_redis.MultiSet(a)
+            getattr(c, op)(b)
+            getattr(d, op)(b)
+            # Counter equality ignores zero counts on Python 3.10+.
+            self.assertEqual(dict(d.value), dict(c))
+        for op in ("__iand__", "__ior__"):
+            c = collections.Counter(wagwaan=0, hot=-1, skull=2)
+            d = hot_redis.MultiSet(c)
+            getattr(c, op)(collections.Counter(flute=1, skull=1))
+            getattr(d, op)(collections.Counter(flute=1, skull=1))
+            self.assertEqual(dict(d.value), dict(c))
+
     def test_elements(self):
         a = "wagwaan"
         b = {"hotskull": 420}
@@ -1072,6 +1796,151 @@ class CounterTests(BaseTestCase):
         for i, e in enumerate(c.most_common()):
             self.assertEqual(e[1], check[i][1])
 
+
+class SortedCounterTests(BaseTestCase):
+
+    def test_value(self):
+        a = "wagwaan"
+        b = {"hot": 420, "skull": -9000}
+        self.assertEqual(hot_redis.SortedMultiSet(a), collections.Counter(a))
+        c = hot_redis.SortedMultiSet(**b)
+        self.assertEqual(c, collections.Counter(**b))
+        self.assertEqual(c["hot"], 420)
+        self.assertEqual(c["flute"], 0)
+        self.assertIn("skull", c)
+        self.assertEqual(len(c), 2)
+        del c["skull"]
+        self.assertEqual(c.get("skull"), None)
+        self.assertEqual(hot_redis.fetch(c), [collections.Counter(hot=420)])
+
+    def test_update(self):
+        a = "wagwaan"
+        b = "flute don"
+        c = collections.Counter(a)
+        d = hot_redis.SortedMultiSet(a)
+        c.update(b)
+        d.update(hot_redis.SortedMultiSet(b))
+        self.assertEqual(d, c)
+        c.subtract(a)
+        d.subtract(a)
+        self.assertEqual(d, c)
+        c += collections.Counter(hot=2)
+        d += collections.Counter(hot=2)
+        self.assertEqual(d, c)
+
+    def test_operators(self):
+        a = collections.Counter("wagwaan")
+        a["skull"] = -1
+        b = collections.Counter("flute don")
+        for op in ("__add__", "__sub__", "__and__", "__or__"):
+            c = hot_redis.SortedMultiSet(a)
+            self.assertEqual(getattr(c, op)(b), getattr(a, op)(b))
+        for op, other in (("__iand__", b), ("__ior__", b),
+                          ("__iand__", hot_redis.SortedMultiSet(b)),
+                          ("__ior__", hot_redis.SortedMultiSet(b))):
+            c = collections.Counter(a)
+            d = hot_redis.SortedMultiSet(a)
+            getattr(c, op)(b)
+            getattr(d, op)(other)
+            self.assertEqual(d.value, c)
+
+    def test_elements(self):
+        a = collections.Counter("wagwaan")
+        a["skull"] = -1
+        b = hot_redis.SortedMultiSet(a)
+        self.assertEqual(sorted(b.elements()), sorted(a.elements()))
+
+    def test_most_common(self):
+        a = collections.Counter("wagwaan")
+        b = hot_redis.SortedMultiSet(a)
+        self.assertEqual(b.most_common(1), a.most_common(1))
+        self.assertEqual([v for k, v in b.most_common()],
+                         [v for k, v in a.most_common()])
+        self.assertEqual(b.most_common(0), [])
+
+    def test_mapping(self):
+        a = collections.Counter("wagwaan")
+        b = hot_redis.SortedMultiSet(a)
+        c = b.copy()
+        self.assertNotEqual(c.key, b.key)
+        self.assertEqual(c.value, a)
+        self.assertEqual(b.setdefault("a"), 3)
+        self.assertEqual(b.setdefault("hot", 2), 2)
+        self.assertEqual(b.setdefault("skull"), 0)
+        self.assertEqual(b.pop("hot"), 2)
+        self.assertEqual(b.pop("hot", "flute"), "flute")
+        self.assertRaises(KeyError, lambda: b.pop("hot"))
+        self.assertEqual(dict(b.iteritems()), dict(a, skull=0))
+        b.clear()
+        self.assertEqual(len(b), 0)
+        self.assertEqual(c.value, a)
+
+
+class CodecTests(BaseTestCase):
+
+    def test_list(self):
+        a = [{"wagwaan": [1, 2]}, {"hot": None}, {"skull": 3.5}]
+        b = hot_redis.List(a, codec=hot_redis.JSONCodec())
+        self.assertEqual(b, a)
+        self.assertEqual(b[1], a[1])
+        b.append({"flute": "don"})
+        self.assertEqual(b.pop(), {"flute": "don"})
+        c = hot_redis.List(key=b.key, codec=hot_redis.JSONCodec())
+        self.assertEqual(c[:], a)
+
+    def test_dict(self):
+        a = {"wagwaan": (1, "hot"), "skull": (2.5, "flute")}
+        b = hot_redis.Dict(a, codec=hot_redis.PickleCodec())
+        self.assertEqual(b, a)
+        self.assertEqual(b["wagwaan"], a["wagwaan"])
+        self.assertItemsEqual(b.values(), a.values())
+        b["don"] = b"\xff\x00"
+        self.assertEqual(b.get("don"), b"\xff\x00")
+        self.assertEqual(b.copy(), b.value)
+
+    def test_set(self):
+        a = set([1.5, -2.25, 1e10])
+        b = hot_redis.Set(a, codec=hot_redis.StructCodec("<d"))
+        self.assertEqual(b, a)
+        self.assertIn(1.5, b)
+        b.remove(1.5)
+        self.assertNotIn(1.5, b)
+        self.assertEqual(b.pop() in a, True)
+
+    def test_struct(self):
+        a = [(1, 2.5), (3, -4.0), (5, 6.25)]
+        b = hot_redis.List(a, codec=hot_redis.StructCodec("<if"))
+        self.assertEqual(b, a)
+        self.assertEqual(b[-1], a[-1])
+
+    def test_string(self):
+        a = {"wagwaan": ["hot", "skull"]}
+        b = hot_redis.String(a, codec=hot_redis.JSONCodec())
+        self.assertEqual(b.value, a)
+
+    def test_compression(self):
+        codec = hot_redis.ZlibCodec(threshold=100)
+        a = "wagwaan hotskull " * 1000
+        b = hot_redis.String(a, codec=codec)
+        self.assertEqual(b.value, a)
+        self.assertLess(len(b), len(a) / 10)
+        c = hot_redis.List(["popcaan", a.encode("utf-8")], codec=codec)
+        self.assertEqual(c[:], ["popcaan", a.encode("utf-8")])
+        d = {"flute": {"don": a}}
+        e = hot_redis.Dict(d, codec=hot_redis.ZlibCodec(hot_redis.JSONCodec()))
+        self.assertEqual(e, d)
+        self.assertEqual(codec.stats["encoded"], 3)
+        self.assertEqual(codec.stats["compressed"], 2)
+        self.assertGreater(codec.ratio, 10)
+
+    def test_queue(self):
+        q = hot_redis.Queue(codec=hot_redis.JSONCodec())
+        q.put({"wagwaan": 1})
+        q.put(["hotskull"])
+        self.assertEqual(q.get(), {"wagwaan": 1})
+        self.assertEqual(q.get(block=False), ["hotskull"])
+
+
 @unittest.skipIf(TEST_NO_LUA, "No Lua")
 class TransactionTests(BaseTestCase):
 
@@ -1085,6 +1954,116 @@ class TransactionTests(BaseTestCase):
         self.assertEqual(len(without_transaction), 2)
 
 
+@unittest.skipIf(TEST_NO_LUA, "No Lua")
+class ExpressionTests(BaseTestCase):
+
+    def test_numeric(self):
+        a = hot_redis.Int(420)
+        b = hot_redis.Int(9)
+        c = hot_redis.Float(2.5)
+        d = hot_redis.lazy(a) + b * 2 - 1
+        self.assertEqual(d.evaluate(), 437)
+        self.assertTrue(isinstance(d.evaluate(), int))
+        self.assertEqual((hot_redis.lazy(a) // b % 5).evaluate(), 1)
+        self.assertEqual((2 ** hot_redis.lazy(b)).evaluate(), 512)
+        self.assertAlmostEqual((hot_redis.lazy(a) / b).evaluate(), 420 / 9.)
+        self.assertAlmostEqual((hot_redis.lazy(c) * a).evaluate(), 1050.)
+        e = (hot_redis.lazy(a) + c).store()
+        self.assertTrue(isinstance(e, hot_redis.Float))
+        self.assertAlmostEqual(e, 422.5)
+        e.delete()
+
+    def test_counters(self):
+        a = hot_redis.ShardedInt(shards=4)
+        for i in range(20):
+            a += 1
+        b = (hot_redis.lazy(a) + hot_redis.Int(0)).evaluate()
+        self.assertEqual(b, 20)
+        self.assertTrue(isinstance(b, int))
+        c = hot_redis.BufferedInt(5, flush_interval=60)
+        c += 10
+        self.assertEqual((hot_redis.lazy(c) + 0).evaluate(), 15)
+        d = hot_redis.lazy(hot_redis.String("420")) + 1
+        self.assertRaises(TypeError, d.evaluate)
+
+    def test_sets(self):
+        a = set(["wagwaan", "hot", "skull"])
+        b = set(["hot", "flute", "don"])
+        c = set(["skull", "popcaan"])
+        d, e, f = hot_redis.Set(a), hot_redis.Set(b), hot_redis.Set(c)
+        g = hot_redis.lazy(d)
+        self.assertEqual((g & e | f).evaluate(), a & b | c)
+        self.assertEqual((g - e - f).evaluate(), a - b - c)
+        self.assertEqual((g ^ e).evaluate(), a ^ b)
+        self.assertEqual((g & set(["hot"])).evaluate(), set(["hot"]))
+        h = (g | e).store()
+        self.assertEqual(h, a | b)
+        (g & e).store(h.key)
+        self.assertEqual(h, a & b)
+        h.delete()
+        client = hot_redis.default_client()
+        self.assertEqual(client.keys("*-expression-*"), [])
+        i = hot_redis.Set([1, 2], codec=hot_redis.JSONCodec())
+        j = hot_redis.lazy(i) | set([9])
+        self.assertEqual(j.evaluate(), set([1, 2, 9]))
+        k = j.store()
+        self.assertEqual(k.value, set([1, 2, 9]))
+        k.delete()
+
+    def test_set_scripts(self):
+        a = hot_redis.lazy(hot_redis.Set(["wagwaan", "hot"]))
+        scripts = set()
+        for i in range(1, 6):
+            b = set(range(i))
+            c = (a | b) & (b | set(["hot"]))
+            self.assertEqual(c.evaluate(), set(["hot"]) | set(map(str, b)))
+            scripts.add(c._compile()[0])
+        self.assertEqual(len(scripts), 1)
+        self.assertEqual((a - set()).evaluate(), set(["wagwaan", "hot"]))
+
+    def test_set_error(self):
+        a = hot_redis.String("wagwaan")
+        b = hot_redis.lazy(hot_redis.Set(key=a.key)) | set(["hot"])
+        self.assertRaises(Exception, b.evaluate)
+        client = hot_redis.default_client()
+        self.assertEqual(client.keys("*-expression-*"), [])
+
+
+class FetchTests(BaseTestCase):
+
+    def test_fetch(self):
+        a = [
+            hot_redis.Int(420),
+            hot_redis.Float(4.5),
+            hot_redis.String("wagwaan"),
+            hot_redis.String(),
+            hot_redis.List(["hot", "skull"]),
+            hot_redis.Set(["flute", "don"]),
+            hot_redis.Dict({"pop": "caan"}),
+            hot_redis.Dict({"pop": [1]}, codec=hot_redis.JSONCodec()),
+            hot_redis.MultiSet("wagwaan"),
+            hot_redis.BufferedInt(1, flush_interval=60),
+            hot_redis.ShardedInt(7, shards=2),
+        ]
+        a[-1] += 1
+        self.assertEqual(hot_redis.fetch(*a), [b.value for b in a])
+        self.assertEqual(hot_redis.fetch(), [])
+
+    def test_snapshot(self):
+        a = hot_redis.List(["hot", "skull"])
+        b = hot_redis.Int(9000)
+        self.assertEqual(a.snapshot, None)
+        hot_redis.fetch(a, b, snapshot=True)
+        self.assertEqual(a.snapshot, ["hot", "skull"])
+        self.assertEqual(b.snapshot, 9000)
+
+    def test_values(self):
+        a = hot_redis.List(["hot", "skull"])
+        b = hot_redis.String("wagwaan")
+        c = hot_redis.values({"a": a, "b": b})
+        self.assertEqual(c, {"a": ["hot", "skull"], "b": "wagwaan"})
+
+
 @unittest.skipIf(TEST_NO_LUA, "No Lua")
 class LockTests(BaseTestCase):
 
@@ -1104,6 +2083,19 @@ class LockTests(BaseTestCase):
                 self.assertEqual(semaphore.acquire(block=False), False)
         self.assertRaises(RuntimeError, semaphore.release)
 
+    def test_wake_on_release(self):
+        semaphore = hot_redis.BoundedSemaphore(value=2)
+        semaphore.acquire()
+        semaphore.acquire()
+        threading.Timer(.2, semaphore.release).start()
+        start = time.time()
+        self.assertTrue(semaphore.acquire(timeout=5))
+        self.assertTrue(time.time() - start < 1)
+        start = time.time()
+        self.assertFalse(semaphore.acquire(timeout=.25))
+        self.assertTrue(time.time() - start >= .25)
+        semaphore.delete()
+
     def test_lock(self):
         lock = hot_redis.Lock()
         self.assertEqual(lock.acquire(), True)
@@ -1112,6 +2104,215 @@ class LockTests(BaseTestCase):
             self.assertEqual(lock.acquire(block=False), False)
         self.assertRaises(RuntimeError, lock.release)
 
+    def test_lock_owner(self):
+        a = hot_redis.Lock(lease_time=5)
+        b = hot_redis.Lock(key=a.key)
+        self.assertFalse(a.locked())
+        self.assertEqual(a.owner, None)
+        self.assertEqual(a.ttl, None)
+        a.acquire()
+        self.assertTrue(b.locked())
+        self.assertEqual(b.owner, a.token)
+        self.assertTrue(0 < b.ttl <= 5)
+        self.assertRaises(RuntimeError, b.release)
+        threading.Timer(.2, a.release).start()
+        start = time.time()
+        self.assertTrue(b.acquire(timeout=5))
+        self.assertTrue(time.time() - start < 1)
+        b.release()
+        b.delete()
+
+    def test_lock_lease(self):
+        a = hot_redis.Lock(lease_time=.3, renew=False)
+        b = hot_redis.Lock(key=a.key, lease_time=.3)
+        a.acquire()
+        start = time.time()
+        self.assertTrue(b.acquire(timeout=5))
+        self.assertTrue(time.time() - start < 1)
+        self.assertRaises(RuntimeError, a.release)
+        time.sleep(.5)
+        self.assertEqual(b.owner, b.token)
+        self.assertFalse(a.acquire(timeout=.1))
+        b.release()
+        b.delete()
+
+    def test_rlock(self):
+        lock = hot_redis.RLock()
+        self.assertTrue(lock.acquire())
+        token = lock.owner
+        with lock:
+            self.assertEqual(lock.depth, 2)
+        self.assertTrue(lock.locked())
+        self.assertEqual(lock.owner, token)
+        results = []
+
+        def other_thread():
+            results.append(lock.acquire(block=False))
+            self.assertRaises(RuntimeError, lock.release)
+            results.append(lock.acquire(timeout=5))
+            lock.release()
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        time.sleep(.2)
+        lock.release()
+        thread.join()
+        self.assertEqual(results, [False, True])
+        self.assertFalse(lock.locked())
+        self.assertRaises(RuntimeError, lock.release)
+        lock.delete()
+
+    def test_read_write_lock(self):
+        a = hot_redis.ReadWriteLock()
+        b = hot_redis.ReadWriteLock(key=a.key)
+        with a.read():
+            self.assertTrue(b.acquire_read(block=False))
+            self.assertFalse(b.acquire_write(timeout=.1))
+            self.assertEqual(len(a.value["readers"]), 2)
+            b.release_read()
+        self.assertRaises(RuntimeError, a.release_read)
+        with a.write():
+            self.assertFalse(b.acquire_read(block=False))
+            self.assertFalse(b.acquire_write(block=False))
+        acquired = threading.Event()
+
+        def writer():
+            b.acquire_write()
+            acquired.set()
+            time.sleep(.2)
+            b.release_write()
+
+        threading.Thread(target=writer).start()
+        acquired.wait()
+        start = time.time()
+        self.assertTrue(a.acquire_read(timeout=5))
+        self.assertTrue(time.time() - start < 1)
+        a.release_read()
+        a.delete()
+
+    def test_read_write_lock_preference(self):
+        a = hot_redis.ReadWriteLock(lease_time=.5)
+        b = hot_redis.ReadWriteLock(key=a.key)
+        a.acquire_read()
+        results = []
+
+        def writer():
+            results.append(b.acquire_write(timeout=5))
+            b.release_write()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(.1)
+        # Readers queue up behind the waiting writer.
+        self.assertFalse(b.acquire_read(block=False))
+        a.release_read()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertTrue(b.acquire_read(block=False))
+        b.release_read()
+        # Expired leases don't block writers.
+        a.acquire_read()
+        start = time.time()
+        self.assertTrue(b.acquire_write(timeout=5))
+        self.assertTrue(time.time() - start < 1)
+        b.release_write()
+        a.delete()
+
+    def test_event(self):
+        a = hot_redis.Event()
+        b = hot_redis.Event(key=a.key)
+        self.assertFalse(b.is_set())
+        self.assertFalse(b.wait(.1))
+        threading.Timer(.2, a.set).start()
+        start = time.time()
+        self.assertTrue(b.wait(5))
+        self.assertTrue(time.time() - start < 1)
+        self.assertTrue(b.is_set())
+        self.assertTrue(b.wait())
+        a.clear()
+        self.assertFalse(b.is_set())
+
+    def test_condition(self):
+        a = hot_redis.Condition()
+        b = hot_redis.Condition(key=a.key)
+        items = hot_redis.List()
+        self.assertRaises(RuntimeError, a.wait)
+        self.assertRaises(RuntimeError, a.notify)
+        with a:
+            self.assertFalse(a.wait(.1))
+        results = []
+
+        def consumer():
+            with b:
+                results.append(b.wait_for(lambda: len(items) > 0, 5))
+
+        thread = threading.Thread(target=consumer)
+        thread.start()
+        while not a.llen():
+            time.sleep(.01)
+        start = time.time()
+        with a:
+            items.append(1)
+            a.notify()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertTrue(time.time() - start < 1)
+        items.pop()
+        threads = [threading.Thread(target=consumer) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while a.llen() < 3:
+            time.sleep(.01)
+        with a:
+            items.append(2)
+            a.notify_all()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(a.llen(), 0)
+
+    def test_barrier(self):
+        actions = []
+        barrier = hot_redis.Barrier(3, action=lambda: actions.append(1))
+        results = []
+
+        def party():
+            results.append(barrier.wait(5))
+
+        for _ in range(2):
+            threads = [threading.Thread(target=party) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(results), [0, 0, 1, 1, 2, 2])
+        self.assertEqual(actions, [1, 1])
+        self.assertEqual(barrier.n_waiting, 0)
+
+    def test_barrier_broken(self):
+        a = hot_redis.Barrier(2)
+        b = hot_redis.Barrier(2, key=a.key)
+        self.assertRaises(hot_redis.BrokenBarrierError, a.wait, .1)
+        self.assertTrue(b.broken)
+        self.assertRaises(hot_redis.BrokenBarrierError, b.wait)
+        a.reset()
+        self.assertFalse(b.broken)
+        errors = []
+
+        def party():
+            try:
+                b.wait(5)
+            except hot_redis.BrokenBarrierError:
+                errors.append(1)
+
+        thread = threading.Thread(target=party)
+        thread.start()
+        while not a.n_waiting:
+            time.sleep(.01)
+        a.abort()
+        thread.join()
+        self.assertEqual(errors, [1])
+
 
 if __name__ == "__main__":
     unittest.main()
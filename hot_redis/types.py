@@ -1,6 +1,12 @@
 
+import atexit
+import codecs
 import collections
+import contextlib
+import io
 import operator
+import random
+import threading
 import time
 import uuid
 
@@ -15,6 +21,7 @@ except ImportError:
 import redis
 
 from .client import default_client, transaction
+from .codec import ENCODING_ERRORS, to_bytes
 
 
 ####################################################################
@@ -87,9 +94,14 @@ class Base(object):
     Redis client.
     """
 
-    def __init__(self, initial=None, key=None, client=None):
+    codec = None
+    snapshot = None
+
+    def __init__(self, initial=None, key=None, client=None, codec=None):
         self.client = client  # Must be first.
         self.key = key or str(uuid.uuid4())
+        if codec is not None:
+            self.codec = codec
         if initial is not None:
             if key is None:
                 self.value = initial
@@ -120,6 +132,71 @@ class Base(object):
             raise
         return lambda *a, **k: func(self.key, *a, **k)
 
+    def _multi(self, *commands):
+        """
+        Runs the given (name, args) commands atomically in a MULTI
+        pipeline, or adds them to the current pipeline when called
+        inside ``transaction()``.
+        """
+        client = self.client or default_client()
+        if isinstance(client, redis.client.Pipeline):
+            pipe = client
+        else:
+            pipe = client.pipeline()
+        for name, args in commands:
+            getattr(pipe, name)(*args)
+        if pipe is not client:
+            return pipe.execute()
+
+    def _subscribe(self, channel):
+        """
+        Returns a PubSub subscribed to the given channel, once the
+        subscription is confirmed by Redis, so that no messages
+        published after returning are missed.
+        """
+        client = self.client or default_client()
+        pubsub = client.pubsub()
+        pubsub.subscribe(channel)
+        while True:
+            message = pubsub.get_message(timeout=None)
+            if message and message["type"] == "subscribe":
+                return pubsub
+
+    def _fetch_command(self):
+        """
+        Returns the client method name and args for reading the
+        value in a pipeline, used by ``fetch``. Types that can't be
+        read with a single command return None.
+        """
+        return None
+
+    def _fetch_value(self, raw):
+        """
+        Returns the value from the raw response to the command given
+        by ``_fetch_command``.
+        """
+        return raw
+
+    def _encode(self, value):
+        if self.codec is None:
+            return value
+        return self.codec.encode(value)
+
+    def _decode(self, value):
+        if self.codec is None or value is None:
+            return value
+        return self.codec.decode(value)
+
+    def _encode_many(self, values):
+        if self.codec is None:
+            return values
+        return self.codec.encode_many(values)
+
+    def _decode_many(self, values):
+        if self.codec is None:
+            return values
+        return self.codec.decode_many(values)
+
 
 class Bitwise(Base):
     """
@@ -203,6 +280,12 @@ class List(Sequential):
     def value(self, value):
         self.extend(value)
 
+    def _fetch_command(self):
+        return "lrange", (self.key, 0, -1)
+
+    def _fetch_value(self, raw):
+        return self._decode_many(raw)
+
     __iadd__ = inplace("extend")
     __imul__ = inplace("list_multiply")
 
@@ -211,7 +294,7 @@ class List(Sequential):
 
     def __setitem__(self, i, item):
         try:
-            self.lset(i, item)
+            self.lset(i, self._encode(item))
         except redis.exceptions.ResponseError:
             raise IndexError
 
@@ -219,11 +302,11 @@ class List(Sequential):
         if isinstance(i, slice):
             start = i.start if i.start is not None else 0
             stop = i.stop if i.stop is not None else 0
-            return self.lrange(start, stop - 1)
+            return self._decode_many(self.lrange(start, stop - 1))
         item = self.lindex(i)
         if item is None:
             raise IndexError
-        return item
+        return self._decode(item)
 
     def __delitem__(self, i):
         self.pop(i)
@@ -235,21 +318,22 @@ class List(Sequential):
         self.extend([item])
 
     def extend(self, other):
-        self.rpush(*other)
+        self.rpush(*self._encode_many(other))
 
     def insert(self, i, item):
         if i == 0:
-            self.lpush(item)
+            self.lpush(self._encode(item))
         else:
-            self.list_insert(i, item)
+            self.list_insert(i, self._encode(item))
 
     def pop(self, i=-1):
         if i == -1:
-            return self.rpop()
+            item = self.rpop()
         elif i == 0:
-            return self.lpop()
+            item = self.lpop()
         else:
-            return self.list_pop(i)
+            item = self.list_pop(i)
+        return self._decode(item)
 
     def reverse(self):
         self.list_reverse()
@@ -271,12 +355,18 @@ class Set(Bitwise):
 
     @property
     def value(self):
-        return self.smembers()
+        return self._fetch_value(self.smembers())
 
     @value.setter
     def value(self, item):
         self.update(item)
 
+    def _fetch_command(self):
+        return "smembers", (self.key,)
+
+    def _fetch_value(self, raw):
+        return set(self._decode_many(raw))
+
     def _all_redis(self, sets):
         return all([isinstance(s, self.__class__) for s in sets])
 
@@ -305,7 +395,7 @@ class Set(Bitwise):
         return self.scard()
 
     def __contains__(self, item):
-        return self.sismember(item)
+        return self.sismember(self._encode(item))
 
     def __iter__(self):
         return iter(self.value)
@@ -314,16 +404,16 @@ class Set(Bitwise):
         self.update([item])
 
     def update(self, *sets):
-        self.sadd(*reduce(operator.or_, sets))
+        self.sadd(*self._encode_many(reduce(operator.or_, sets)))
 
     def pop(self):
-        return self.spop()
+        return self._decode(self.spop())
 
     def clear(self):
         self.delete()
 
     def remove(self, item):
-        if self.srem(item) == 0:
+        if self.srem(self._encode(item)) == 0:
             raise KeyError(item)
 
     def discard(self, item):
@@ -334,7 +424,7 @@ class Set(Bitwise):
 
     def intersection(self, *sets):
         if self._all_redis(sets):
-            return self.sinter(*self._to_keys(sets))
+            return set(self._decode_many(self.sinter(*self._to_keys(sets))))
         else:
             return reduce(operator.and_, (self.value,) + sets)
 
@@ -343,18 +433,18 @@ class Set(Bitwise):
             self.sinterstore(self.key, *self._to_keys(sets))
         else:
             sets = list(reduce(operator.and_, sets))
-            self.set_intersection_update(*sets)
+            self.set_intersection_update(*self._encode_many(sets))
         return self
 
     def union(self, *sets):
         if self._all_redis(sets):
-            return self.sunion(*self._to_keys(sets))
+            return set(self._decode_many(self.sunion(*self._to_keys(sets))))
         else:
             return reduce(operator.or_, (self.value,) + sets)
 
     def difference(self, *sets):
         if self._all_redis(sets):
-            return self.sdiff(*self._to_keys(sets))
+            return set(self._decode_many(self.sdiff(*self._to_keys(sets))))
         else:
             return reduce(operator.sub, (self.value,) + sets)
 
@@ -365,14 +455,15 @@ class Set(Bitwise):
             key = str(uuid.uuid4())
             flattened = [key]
             for s in sets:
-                flattened.extend(s)
+                flattened.extend(self._encode_many(s))
                 flattened.append(key)
             self.set_difference_update(*flattened)
         return self
 
     def symmetric_difference(self, other):
         if isinstance(other, self.__class__):
-            return set(self.set_symmetric_difference("return", other.key))
+            result = self.set_symmetric_difference("return", other.key)
+            return set(self._decode_many(result))
         else:
             return self.value ^ other
 
@@ -380,7 +471,7 @@ class Set(Bitwise):
         if isinstance(other, self.__class__):
             self.set_symmetric_difference("update", other.key)
         else:
-            self.set_symmetric_difference("create", *other)
+            self.set_symmetric_difference("create", *self._encode_many(other))
         return self
 
     def isdisjoint(self, other):
@@ -400,7 +491,7 @@ class Dict(Base):
 
     @property
     def value(self):
-        return self.hgetall()
+        return self._fetch_value(self.hgetall())
 
     @value.setter
     def value(self, value):
@@ -412,6 +503,14 @@ class Dict(Base):
         if value:
             self.update(value)
 
+    def _fetch_command(self):
+        return "hgetall", (self.key,)
+
+    def _fetch_value(self, raw):
+        if self.codec is not None:
+            raw = dict(zip(raw.keys(), self._decode_many(raw.values())))
+        return raw
+
     def __len__(self):
         return self.hlen()
 
@@ -422,7 +521,7 @@ class Dict(Base):
         return self.iterkeys()
 
     def __setitem__(self, key, value):
-        self.hset(key, value)
+        self.hset(key, self._encode(value))
 
     def __getitem__(self, key):
         value = self.get(key)
@@ -435,13 +534,15 @@ class Dict(Base):
             raise KeyError(key)
 
     def update(self, value):
+        if self.codec is not None:
+            value = dict(zip(value.keys(), self._encode_many(value.values())))
         self.hmset(value)
 
     def keys(self):
         return self.hkeys()
 
     def values(self):
-        return self.hvals()
+        return self._decode_many(self.hvals())
 
     def items(self):
         return self.value.items()
@@ -456,20 +557,22 @@ class Dict(Base):
         return iter(self.items())
 
     def setdefault(self, key, value=None):
-        if self.hsetnx(key, value) == 1:
+        if self.hsetnx(key, self._encode(value)) == 1:
             return value
         else:
             return self.get(key)
 
     def get(self, key, default=None):
         value = self.hget(key)
-        return value if value is not None else default
+        return self._decode(value) if value is not None else default
 
     def has_key(self, key):
         return key in self
 
     def copy(self):
-        return self.__class__(self.value)
+        if self.codec is None:
+            return self.__class__(self.value)
+        return self.__class__(self.value, codec=self.codec)
 
     def clear(self):
         self.delete()
@@ -486,14 +589,24 @@ class String(Sequential):
     Redis string <-> Python string (although mutable).
     """
 
+    chunk_size = 64 * 1024
+
     @property
     def value(self):
-        return self.get() or ""
+        return self._fetch_value(self.get())
 
     @value.setter
     def value(self, value):
         if value:
-            self.set(value)
+            self.set(self._encode(value))
+
+    def _fetch_command(self):
+        return "get", (self.key,)
+
+    def _fetch_value(self, raw):
+        if raw is None:
+            return ""
+        return self._decode(raw)
 
     __iadd__ = inplace("append")
     __imul__ = inplace("string_multiply")
@@ -524,25 +637,192 @@ class String(Sequential):
         return s
 
     def __iter__(self):
-        return iter(self.value)
+        if self.codec is not None:
+            return iter(self.value)
+        return self._iter_chars()
+
+    def _iter_chars(self):
+        # Decoded with the same error handler as responses from the
+        # client, so that bytes which aren't valid UTF-8 round trip.
+        decoder = codecs.getincrementaldecoder("utf-8")(ENCODING_ERRORS)
+        for chunk in self.iter_chunks():
+            for c in decoder.decode(chunk):
+                yield c
+        for c in decoder.decode(b"", True):
+            yield c
+
+    def iter_chunks(self, size=None):
+        """
+        Yields the stored bytes in chunks of the given size, with
+        a GETRANGE per chunk.
+        """
+        size = size or self.chunk_size
+        start = 0
+        while True:
+            chunk = to_bytes(self.getrange(start, start + size - 1))
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                break
+            start += size
+
+    def readinto(self, buffer, offset=0):
+        """
+        Reads the stored bytes starting at offset into the given
+        writable buffer, such as a bytearray, with a GETRANGE per
+        chunk, each of which is copied into the buffer. Returns the
+        number of bytes read.
+        """
+        view = memoryview(buffer)
+        if hasattr(view, "cast"):
+            # Indexed by byte, whatever the buffer's item size.
+            view = view.cast("B")
+        total = 0
+        while total < len(view):
+            size = min(self.chunk_size, len(view) - total)
+            start = offset + total
+            chunk = to_bytes(self.getrange(start, start + size - 1))
+            view[total:total + len(chunk)] = chunk
+            total += len(chunk)
+            if len(chunk) < size:
+                break
+        return total
+
+    def open(self, mode="rb", buffer_size=None):
+        """
+        Returns a buffered binary file object for the string, which
+        reads and writes in blocks of ``buffer_size`` bytes.
+        """
+        if "b" not in mode:
+            raise ValueError("Only binary modes are supported")
+        raw = StringFile(self, mode)
+        buffer_size = buffer_size or self.chunk_size
+        if "+" in mode:
+            return io.BufferedRandom(raw, buffer_size)
+        elif raw.writable():
+            return io.BufferedWriter(raw, buffer_size)
+        return io.BufferedReader(raw, buffer_size)
+
+
+class StringFile(io.RawIOBase):
+    """
+    Raw file object for reading and writing a String's bytes in
+    place, using GETRANGE, SETRANGE and APPEND. Returned by
+    ``String.open`` wrapped in a buffer.
+    """
+
+    def __init__(self, string, mode="rb"):
+        super(StringFile, self).__init__()
+        self.string = string
+        self.mode = mode
+        self.position = 0
+        if "w" in mode:
+            string.delete()
+        elif "a" in mode:
+            self.position = len(string)
+
+    def readable(self):
+        return "r" in self.mode or "+" in self.mode
+
+    def writable(self):
+        return "r" not in self.mode or "+" in self.mode
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.string)
+        if offset < 0:
+            raise ValueError("negative seek position %s" % offset)
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        size = self.string.readinto(buffer, self.position)
+        self.position += size
+        return size
+
+    def write(self, data):
+        # Buffered writers pass a memoryview, which bytes() would
+        # convert to its repr on Python 2.
+        data = memoryview(data).tobytes()
+        if "a" in self.mode:
+            self.position = self.string.append(data)
+        else:
+            self.string.setrange(self.position, data)
+            self.position += len(data)
+        return len(data)
 
 
 class ImmutableString(String):
     """
     Redis string <-> Python string (actually immutable).
+
+    In-place operators copy the value to a new key within Redis. Keys
+    generated by ImmutableString are reference counted across the
+    instances in the current process, and the previous key is
+    released by the copy once no other instance refers to it. Keys
+    that were explicitly provided are never released.
     """
 
-    def __iadd__(self, other):
-        self.key = self.__class__(self + other).key
+    _references = collections.Counter()
+    # Re-entrant, since garbage collection can run __del__ in a
+    # thread that already holds it.
+    _references_lock = threading.RLock()
+
+    def __init__(self, initial=None, key=None, **kwargs):
+        super(ImmutableString, self).__init__(initial, key, **kwargs)
+        with self._references_lock:
+            if key is None or key in self._references:
+                self._references[self.key] += 1
+
+    def __del__(self):
+        key = self.__dict__.get("key")
+        with self._references_lock:
+            if key in self._references:
+                self._references[key] -= 1
+                if self._references[key] <= 0:
+                    del self._references[key]
+
+    def _copy(self, method_name, arg):
+        """
+        Moves the instance to a new key holding a copy of the value
+        with the given atom applied, releasing the previous key if
+        it's no longer referenced.
+        """
+        key = str(uuid.uuid4())
+        with self._references_lock:
+            release = self._references.get(self.key) == 1
+            getattr(self, method_name)(key, arg, int(release))
+            # Only counted once the copy succeeds.
+            if self.key in self._references:
+                self._references[self.key] -= 1
+                if self._references[self.key] <= 0:
+                    del self._references[self.key]
+            self._references[key] += 1
+        self.key = key
         return self
 
+    def __iadd__(self, other):
+        return self._copy("immutable_string_append", value_left(self, other))
+
     def __imul__(self, i):
-        self.key = self.__class__(self * i).key
-        return self
+        return self._copy("immutable_string_multiply", i)
 
     def __setitem__(self, i):
         raise TypeError
 
+    def open(self, mode="rb", buffer_size=None):
+        if mode != "rb":
+            raise TypeError
+        return super(ImmutableString, self).open(mode, buffer_size)
+
 
 class Int(Numeric, Bitwise):
     """
@@ -551,13 +831,19 @@ class Int(Numeric, Bitwise):
 
     @property
     def value(self):
-        return int(float(self.get() or 0))
+        return self._fetch_value(self.get())
 
     @value.setter
     def value(self, value):
         if value is not None:
             self.set(value)
 
+    def _fetch_command(self):
+        return "get", (self.key,)
+
+    def _fetch_value(self, raw):
+        return int(float(raw or 0))
+
     __iand__    = inplace("number_and")
     __ior__     = inplace("number_or")
     __ixor__    = inplace("number_xor")
@@ -572,13 +858,19 @@ class Float(Numeric):
 
     @property
     def value(self):
-        return float(self.get() or 0)
+        return self._fetch_value(self.get())
 
     @value.setter
     def value(self, value):
         if value is not None:
             self.set(value)
 
+    def _fetch_command(self):
+        return "get", (self.key,)
+
+    def _fetch_value(self, raw):
+        return float(raw or 0)
+
     __iadd__ = inplace("incrbyfloat")
 
     def __isub__(self, f):
@@ -586,6 +878,281 @@ class Float(Numeric):
         return self
 
 
+class ShardedInt(Numeric):
+    """
+    Redis integers <-> Python integer, with increments spread across
+    ``shards`` sub-keys chosen at random, so that a heavily written
+    counter doesn't become a single hot key. Reading the value sums
+    the shards with a single MGET, and can be cached locally for
+    ``cache`` seconds. All other in-place operators collapse the
+    shards back into the main key atomically.
+    """
+
+    shards = 8
+    cache = 0
+
+    def __init__(self, initial=None, key=None, shards=None, cache=None,
+                 **kwargs):
+        if shards is not None:
+            self.shards = shards
+        if cache is not None:
+            self.cache = cache
+        self.cached = None
+        super(ShardedInt, self).__init__(initial, key, **kwargs)
+
+    @property
+    def shard_keys(self):
+        return [self.key] + ["%s-%s" % (self.key, i)
+                             for i in range(1, self.shards)]
+
+    @property
+    def value(self):
+        if self.cached is not None and time.time() < self.cached[0]:
+            return self.cached[1]
+        return self._fetch_value(self.mget(*self.shard_keys[1:]))
+
+    @value.setter
+    def value(self, value):
+        if value is not None:
+            (self.client or default_client()).delete(*self.shard_keys[1:])
+            self.set(value)
+            self.cached = None
+
+    def _fetch_command(self):
+        return "mget", (self.shard_keys,)
+
+    def _fetch_value(self, raw):
+        value = sum([int(float(v or 0)) for v in raw])
+        if self.cache:
+            self.cached = (time.time() + self.cache, value)
+        return value
+
+    def delete(self):
+        self._dispatch("delete")(*self.shard_keys[1:])
+        self.cached = None
+
+    def incr(self, amount=1):
+        key = random.choice(self.shard_keys)
+        (self.client or default_client()).incrby(key, amount)
+        if self.cached is not None:
+            self.cached = (self.cached[0], self.cached[1] + amount)
+
+    def decr(self, amount=1):
+        self.incr(-amount)
+
+    def _collapse(self, op, n):
+        self.sharded_number_op(op, n, *self.shard_keys[1:])
+        self.cached = None
+
+    def number_multiply(self, n):
+        self._collapse("multiply", n)
+
+    def number_divide(self, n):
+        self._collapse("divide", n)
+
+    def number_floordiv(self, n):
+        self._collapse("floordiv", n)
+
+    def number_mod(self, n):
+        self._collapse("mod", n)
+
+    def number_pow(self, n):
+        self._collapse("pow", n)
+
+
+class CounterBuffer(object):
+    """
+    Accumulates the increments for all buffered counters in the
+    process, and writes them to Redis with one pipeline per client,
+    containing a single INCRBY or INCRBYFLOAT per counter. A counter
+    is written once its own ``flush_count`` increments have been
+    buffered, and all counters are written once the earliest
+    ``flush_interval`` has elapsed (via a background thread), or when
+    ``flush`` is called, which happens at exit.
+    """
+
+    def __init__(self):
+        # Pending state per counter, keyed by _key: the summed delta,
+        # the number of increments, the counter's flush_interval, and
+        # when the counter is due to be flushed.
+        self.deltas = {}
+        self.counts = {}
+        self.intervals = {}
+        self.deadlines = {}
+        self.deadline = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def _key(self, counter):
+        return (counter.client, counter.increment_command, counter.key)
+
+    def _schedule(self, key, deadline):
+        self.deadlines[key] = deadline
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+            self.condition.notify()
+
+    def _take(self, keys):
+        """
+        Removes and returns the pending state for the given keys,
+        as a list of (key, delta, count, interval) tuples.
+        """
+        taken = []
+        for key in keys:
+            self.deadlines.pop(key, None)
+            if key in self.deltas:
+                taken.append((key, self.deltas.pop(key),
+                              self.counts.pop(key),
+                              self.intervals.pop(key)))
+        self.deadline = None
+        if self.deadlines:
+            self.deadline = min(self.deadlines.values())
+        return taken
+
+    def add(self, counter, delta):
+        with self.condition:
+            key = self._key(counter)
+            self.deltas[key] = self.deltas.get(key, 0) + delta
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.intervals[key] = counter.flush_interval
+            if key not in self.deadlines:
+                self._schedule(key, time.time() + counter.flush_interval)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            full = self.counts[key] >= counter.flush_count
+        if full:
+            self.flush(counter)
+
+    def pending(self, counter):
+        return self.deltas.get(self._key(counter), 0)
+
+    def discard(self, counter):
+        with self.condition:
+            self._take([self._key(counter)])
+
+    def flush(self, counter=None):
+        """
+        Writes the buffered deltas for the given counter, or for all
+        counters if none is given. Deltas are restored to the buffer
+        if writing them fails, and retried after another interval.
+        """
+        with self.condition:
+            if counter is None:
+                taken = self._take(list(self.deltas))
+            else:
+                taken = self._take([self._key(counter)])
+        clients = {}
+        for (client, command, key), delta, count, interval in taken:
+            clients.setdefault(client, []).append((command, key, delta))
+        try:
+            for client, commands in clients.items():
+                pipe = (client or default_client()).pipeline(False)
+                for command, key, delta in commands:
+                    getattr(pipe, command)(key, delta)
+                pipe.execute()
+        except Exception:
+            with self.condition:
+                now = time.time()
+                for key, delta, count, interval in taken:
+                    self.deltas[key] = self.deltas.get(key, 0) + delta
+                    self.counts[key] = self.counts.get(key, 0) + count
+                    self.intervals.setdefault(key, interval)
+                    if key not in self.deadlines:
+                        self._schedule(key, now + interval)
+            raise
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.deadline is None:
+                    self.condition.wait()
+                remaining = self.deadline - time.time()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+            try:
+                self.flush()
+            except redis.exceptions.RedisError:
+                pass
+
+
+counter_buffer = CounterBuffer()
+atexit.register(counter_buffer.flush)
+
+
+def flush_counters():
+    """
+    Writes the buffered increments for all counters in the process.
+    """
+    counter_buffer.flush()
+
+
+class Buffered(object):
+    """
+    Mixin for numeric types that accumulates increments in process,
+    trading a little staleness in Redis for far fewer round trips.
+    Reading the value includes the increments not yet written, and
+    any other operation writes them first.
+    """
+
+    flush_count = 1000
+    flush_interval = 1.
+
+    def __init__(self, initial=None, key=None, flush_count=None,
+                 flush_interval=None, **kwargs):
+        if flush_count is not None:
+            self.flush_count = flush_count
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        super(Buffered, self).__init__(initial, key, **kwargs)
+
+    @property
+    def value(self):
+        return super(Buffered, self).value
+
+    @value.setter
+    def value(self, value):
+        counter_buffer.discard(self)
+        super(Buffered, type(self)).value.fset(self, value)
+
+    def _fetch_value(self, raw):
+        value = super(Buffered, self)._fetch_value(raw)
+        return value + counter_buffer.pending(self)
+
+    def _dispatch(self, name):
+        if name != "get":
+            counter_buffer.flush(self)
+        return super(Buffered, self)._dispatch(name)
+
+    def flush(self):
+        counter_buffer.flush(self)
+
+    def incr(self, amount=1):
+        counter_buffer.add(self, amount)
+
+    def decr(self, amount=1):
+        counter_buffer.add(self, -amount)
+
+    def incrbyfloat(self, amount):
+        counter_buffer.add(self, amount)
+
+
+class BufferedInt(Buffered, Int):
+    """
+    Redis integer <-> Python integer, with increments buffered.
+    """
+    increment_command = "incrby"
+
+
+class BufferedFloat(Buffered, Float):
+    """
+    Redis float <-> Python float, with increments buffered.
+    """
+    increment_command = "incrbyfloat"
+
+
 ###################################################################
 #                                                                 #
 #  Following are the types found in the Python standard library,  #
@@ -597,9 +1164,28 @@ class Float(Numeric):
 class Queue(List):
     """
     Redis list <-> Python list <-> Python's Queue.
+
+    When a ``maxsize`` is given, producers blocked on a full queue
+    register themselves in a "waiters" count, and wait on a separate
+    "space" list, using BLPOP with their remaining timeout. Each item
+    taken from the queue pushes a token onto the space list for a
+    registered producer, waking it, and tokens don't build up when no
+    producers are waiting. Since space can also appear without a
+    token, such as when a consumer dies before pushing one, or items
+    are removed with ``List`` methods, each BLPOP waits for at most
+    ``space_poll_interval`` seconds before the put is retried.
+
+    The count of unfinished tasks for ``task_done`` and ``join`` is
+    kept in a "tasks" hash, incremented atomically with each put.
+    Callers of ``join`` register themselves in the same hash, and
+    block on a "done" list, which receives a token for each of them
+    once the count reaches zero.
     """
 
     maxsize = 0
+    track_tasks = True
+    space_poll_interval = 5
+    push_command = "RPUSH"
 
     def __init__(self, maxsize=None, **kwargs):
         if maxsize is not None:
@@ -610,6 +1196,27 @@ class Queue(List):
     def queue(self):
         return self
 
+    @property
+    def space_key(self):
+        return "%s-space" % self.key
+
+    @property
+    def waiters_key(self):
+        return "%s-waiters" % self.space_key
+
+    @property
+    def tasks_key(self):
+        return "%s-tasks" % self.key
+
+    @property
+    def done_key(self):
+        return "%s-done" % self.key
+
+    @property
+    def unfinished_tasks(self):
+        client = self.client or default_client()
+        return int(client.hget(self.tasks_key, "unfinished") or 0)
+
     def qsize(self):
         return len(self)
 
@@ -619,19 +1226,73 @@ class Queue(List):
     def full(self):
         return self.maxsize > 0 and self.qsize() >= self.maxsize
 
+    def delete(self):
+        self._dispatch("delete")(self.space_key, self.waiters_key,
+                                 self.tasks_key, self.done_key)
+
+    def _wait_for_space(self, put, block, timeout):
+        """
+        Calls ``put`` until it succeeds, blocking on the space list
+        between attempts, and raising queue.Full once ``timeout``
+        seconds have passed, or immediately if not blocking. ``put``
+        is given the space key to register as waiting on when it
+        fails, or an empty string when not blocking.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+        space_key = self.space_key if block else ""
+        client = self.client or default_client()
+        while not put(space_key):
+            if not block:
+                raise queue.Full
+            wait = self.space_poll_interval
+            if timeout is not None:
+                # A zero timeout would make BLPOP block forever.
+                wait = min(wait, max(deadline - time.time(), .001))
+            if client.blpop(self.space_key, timeout=wait) is None:
+                # Unregistered before retrying, which registers again
+                # if the queue is still full.
+                self.queue_cancel_wait(self.space_key)
+                if timeout is not None and time.time() >= deadline:
+                    raise queue.Full
+
+    def _notify_space(self):
+        """
+        Pushes a token onto the space list after an item is taken
+        from the queue, if a producer is waiting for space.
+        """
+        if self.maxsize > 0:
+            self.queue_pop_many(self.space_key, self.maxsize, 0, 1)
+
+    def extend(self, other):
+        push = self._dispatch(self.push_command.lower())
+        push(*self._encode_many(other))
+
     def put(self, item, block=True, timeout=None):
+        self.put_many([item], block, timeout)
+
+    def put_many(self, items, block=True, timeout=None):
+        """
+        Puts all of the given items on the queue in a single call.
+        With a ``maxsize``, the items are only added once there's
+        space for all of them.
+        """
+        items = list(self._encode_many(list(items)))
+        if not items:
+            return
         if self.maxsize == 0:
-            self.append(item)
+            commands = [(self.push_command.lower(), [self.key] + items)]
+            if self.track_tasks:
+                args = (self.tasks_key, "unfinished", len(items))
+                commands.append(("hincrby", args))
+            self._multi(*commands)
+        elif len(items) > self.maxsize:
+            raise ValueError("Can't put more than maxsize items")
         else:
-            if not block:
-                timeout = 0
-            start = time.time()
-            while True:
-                if self.queue_put(item, self.maxsize):
-                    break
-                if timeout is not None and time.time() - start >= timeout:
-                    raise queue.Full
-                time.sleep(.1)
+            tasks_key = self.tasks_key if self.track_tasks else ""
+            put = lambda space_key: self.queue_put(
+                self.maxsize, self.push_command, tasks_key, space_key, *items)
+            self._wait_for_space(put, block, timeout)
 
     def put_nowait(self, item):
         self.put(item, block=False)
@@ -641,18 +1302,44 @@ class Queue(List):
             item = self.blpop(timeout=timeout)
             if item is not None:
                 item = item[1]
+                self._notify_space()
+        elif self.maxsize == 0:
+            item = self.lpop()
         else:
-            item = self.pop()
+            item = self.queue_pop(self.space_key, self.maxsize)
         if item is None:
             raise queue.Empty
-        return item
+        return self._decode(item)
+
+    def get_many(self, count, block=True, timeout=None):
+        """
+        Takes up to ``count`` items from the queue in a single call.
+        When blocking, waits for at least one item, then takes as many
+        of the rest as are available without waiting any longer.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        args = (self.space_key, self.maxsize)
+        items = self.queue_pop_many(*(args + (count, 0)))
+        if not items and block:
+            item = self.blpop(timeout=timeout)
+            if item is not None:
+                items = [item[1]]
+                items.extend(self.queue_pop_many(*(args + (count - 1, 1))))
+        if not items:
+            raise queue.Empty
+        return list(self._decode_many(items))
 
     def get_nowait(self):
         return self.get(block=False)
 
+    def task_done(self):
+        if self.queue_task_done(self.tasks_key, self.done_key) < 0:
+            raise ValueError("task_done() called too many times")
+
     def join(self):
-        while not self.empty():
-            sleep(.1)
+        while self.queue_join(self.tasks_key) > 0:
+            (self.client or default_client()).blpop(self.done_key)
 
 
 class LifoQueue(Queue):
@@ -660,31 +1347,67 @@ class LifoQueue(Queue):
     Redis list <-> Python list <-> Python's Queue.LifoQueue.
     """
 
-    def append(self, item):
-        self.lpush(item)
+    push_command = "LPUSH"
 
 
 class SetQueue(Queue):
     """
     Redis list + Redis set <-> Queue with only unique items.
+
+    Items are added to both the list and set, and removed from both,
+    atomically in a single call.
     """
 
     def __init__(self, *args, **kwargs):
         super(SetQueue, self).__init__(*args, **kwargs)
-        self.set = Set(key="%s-set" % self.key)
+        self.set = Set(key=self.set_key, client=self.client,
+                       codec=self.codec)
+
+    @property
+    def set_key(self):
+        return "%s-set" % self.key
+
+    def extend(self, other):
+        self.put_many(other)
 
-    def get(self, *args, **kwargs):
-        item = super(SetQueue, self).get(*args, **kwargs)
-        self.set.remove(item)
-        return item
+    def put_many(self, items, block=True, timeout=None):
+        items = list(self._encode_many(list(items)))
+        if not items:
+            return
+        tasks_key = self.tasks_key if self.track_tasks else ""
+        args = (self.set_key, self.maxsize, self.push_command, tasks_key)
 
-    def put(self, item, *args, **kwargs):
-        if self.set.sadd(item) > 0:
-            super(SetQueue, self).put(item, *args, **kwargs)
+        def put(space_key):
+            # Returns the number of new items added, -1 if there's no
+            # space for them, or -2 if there never can be.
+            added = self.set_queue_put(*(args + (space_key,) + tuple(items)))
+            if added == -2:
+                raise ValueError("Can't put more than maxsize items")
+            return added >= 0
+
+        self._wait_for_space(put, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        return self.get_many(1, block, timeout)[0]
+
+    def get_many(self, count, block=True, timeout=None):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        args = (self.set_key, self.space_key, self.maxsize)
+        items = self.set_queue_pop(*(args + (count,)))
+        if not items and block:
+            item = self.blpop(timeout=timeout)
+            if item is not None:
+                items = [item[1]]
+                items.extend(self.set_queue_pop(*(args + (count - 1,
+                                                          item[1]))))
+        if not items:
+            raise queue.Empty
+        return list(self._decode_many(items))
 
     def delete(self):
-        self._dispatch("delete")
-        self.set.delete()
+        super(SetQueue, self).delete()
+        (self.client or default_client()).delete(self.set_key)
 
 
 class LifoSetQueue(LifoQueue, SetQueue):
@@ -694,142 +1417,1190 @@ class LifoSetQueue(LifoQueue, SetQueue):
     pass
 
 
-####################################################################
-#                                                                  #
-#  Next up, some lock structures from the threading module. These  #
-#  are all backed by the above Queue class, since it provides the  #
-#  blocking / non-blocking mechanics desired.                      #
-#                                                                  #
-####################################################################
-
-class BoundedSemaphore(Queue):
+class PriorityQueue(Queue):
     """
-    Redis list <-> Python list <-> Queue <-> threading.BoundedSemaphore.
+    Redis sorted set <-> Python's Queue.PriorityQueue.
 
-    BoundedSemaphore's ``value`` arg maps to Queue's ``maxsize``.
-    BoundedSemaphore's acquire/release methods maps to Queue's put/get
-    methods repectively, providing blocking/timeout mechanics.
+    Items are put and returned as ``(priority, item)`` tuples, with
+    the lowest priority returned first, using ZPOPMIN and BZPOPMIN.
+    Each member is prefixed with a sequence number, so that items
+    with equal priorities are returned in the order they were put.
     """
 
-    maxsize = 1
-
-    def __init__(self, value=None, **kwargs):
-        super(BoundedSemaphore, self).__init__(value, **kwargs)
-
-    def acquire(self, block=True, timeout=None):
-        try:
-            self.put(1, block, timeout)
-        except queue.Full:
-            return False
-        return True
+    @property
+    def sequence_key(self):
+        return "%s-sequence" % self.key
 
-    def release(self):
-        try:
-            self.get(block=False)
-        except queue.Empty:
-            raise RuntimeError("Cannot release unacquired lock")
+    @property
+    def value(self):
+        return self._decode_members(self.zrange(0, -1, withscores=True))
 
-    def __enter__(self):
-        self.acquire()
+    @value.setter
+    def value(self, value):
+        self.extend(value)
 
-    def __exit__(self, t, v, tb):
-        self.release()
+    def _fetch_command(self):
+        return "zrange", (self.key, 0, -1, False, True)
 
+    def _fetch_value(self, raw):
+        return self._decode_members(raw)
 
-class Semaphore(BoundedSemaphore):
-    """
-    Redis list <-> Python list <-> Queue <-> threading.Semaphore.
+    def _decode_members(self, pairs):
+        items = self._decode_many([member.split(":", 1)[1]
+                                   for member, _ in pairs])
+        priorities = [float(score) for _, score in pairs]
+        priorities = [int(p) if p.is_integer() else p for p in priorities]
+        return list(zip(priorities, items))
 
-    Same implementation as BoundedSemaphore, but without a queue size.
-    """
+    def __len__(self):
+        return self.zcard()
 
-    def release(self):
-        try:
-            super(Semaphore, self).release()
-        except RuntimeError:
-            pass
+    def __getitem__(self, i):
+        return self.value[i]
 
+    def __contains__(self, item):
+        return item in self.value
 
-class Lock(BoundedSemaphore):
-    """
-    Redis list <-> Python list <-> Queue <-> threading.Lock.
+    def extend(self, other):
+        self.put_many(other)
 
-    Same implementation as BoundedSemaphore, but with a fixed
-    queue size of 1.
-    """
+    def delete(self):
+        super(PriorityQueue, self).delete()
+        self._dispatch("delete")(self.sequence_key)
+
+    def put_many(self, items, block=True, timeout=None):
+        items = list(items)
+        if not items:
+            return
+        if self.maxsize > 0 and len(items) > self.maxsize:
+            raise ValueError("Can't put more than maxsize items")
+        args = []
+        encoded = self._encode_many([item for _, item in items])
+        for (priority, _), item in zip(items, encoded):
+            args.extend([priority, item])
+        tasks_key = self.tasks_key if self.track_tasks else ""
+        put = lambda space_key: self.priority_queue_put(
+            self.maxsize, tasks_key, self.sequence_key, space_key, *args)
+        self._wait_for_space(put, block, timeout)
 
-    def __init__(self, **kwargs):
-        kwargs["value"] = None
-        super(Lock, self).__init__(**kwargs)
+    def get(self, block=True, timeout=None):
+        return self.get_many(1, block, timeout)[0]
+
+    def get_many(self, count, block=True, timeout=None):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        args = (self.space_key, self.maxsize)
+        items = self.priority_queue_pop(*(args + (count, 0)))
+        items = list(zip(items[::2], items[1::2]))
+        if not items and block:
+            item = self.bzpopmin(timeout=timeout)
+            if item is not None:
+                items = [item[1:]]
+                if count > 1 or self.maxsize > 0:
+                    more = self.priority_queue_pop(*(args + (count - 1, 1)))
+                    items.extend(zip(more[::2], more[1::2]))
+        if not items:
+            raise queue.Empty
+        return self._decode_members(items)
 
 
-class RLock(Lock):
+class DelayQueue(Queue):
     """
-    Redis list <-> Python list <-> Queue <-> threading.RLock.
-
-    Same implementation as BoundedSemaphore, but with a fixed
-    queue size of 1, and as per re-entrant locks, can be acquired
-    multiple times.
+    Queue where items can be put with a ``delay`` in seconds, before
+    which they won't be returned by ``get``. Delayed items are held
+    in a sorted set scored by the time they're due, according to the
+    Redis server's clock. Each ``get`` atomically moves any due items
+    onto the list of ready items before taking from it, and when
+    blocking, waits on the ready list no longer than until the next
+    delayed item is due. Putting an item that's due before all
+    others pushes a token onto a "wakeup" list, which blocked
+    consumers also wait on, so that they can recalculate the wait.
     """
 
-    def __init__(self, *args, **kwargs):
-        self.acquires = 0
-        super(RLock, self).__init__(*args, **kwargs)
+    @property
+    def delayed_key(self):
+        return "%s-delayed" % self.key
 
-    def acquire(self, *args, **kwargs):
-        result = True
-        if self.acquires == 0:
-            result = super(RLock, self).acquire(*args, **kwargs)
-        if result:
-            self.acquires += 1
-        return result
+    @property
+    def wakeup_key(self):
+        return "%s-wakeup" % self.key
 
-    def release(self):
-        if self.acquires > 1:
-            self.acquires -= 1
-            if self.acquires > 0:
-                return
-        super(RLock, self).release()
+    @property
+    def sequence_key(self):
+        return "%s-sequence" % self.key
 
+    def delayed_size(self):
+        """
+        Number of items put with a delay that aren't yet due.
+        """
+        return (self.client or default_client()).zcard(self.delayed_key)
 
-#####################################################################
-#                                                                   #
-#  Some members from Python's collections standard library module.  #
-#                                                                   #
-#####################################################################
+    def delete(self):
+        super(DelayQueue, self).delete()
+        self._dispatch("delete")(self.delayed_key, self.wakeup_key,
+                                 self.sequence_key)
+
+    def put(self, item, block=True, timeout=None, delay=0):
+        self.put_many([item], block, timeout, delay)
+
+    def put_many(self, items, block=True, timeout=None, delay=0):
+        """
+        Puts the items on the queue, or when a ``delay`` is given,
+        schedules them to be moved onto the queue once it's passed.
+        Delayed items aren't limited by ``maxsize``.
+        """
+        if delay <= 0:
+            return super(DelayQueue, self).put_many(items, block, timeout)
+        items = list(self._encode_many(list(items)))
+        if items:
+            tasks_key = self.tasks_key if self.track_tasks else ""
+            self.delay_queue_put(self.delayed_key, int(delay * 1000),
+                                 tasks_key, self.wakeup_key,
+                                 self.sequence_key, *items)
+
+    def get(self, block=True, timeout=None):
+        return self.get_many(1, block, timeout)[0]
+
+    def get_many(self, count, block=True, timeout=None):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        if timeout is not None:
+            deadline = time.time() + timeout
+        args = (self.delayed_key, self.space_key, self.maxsize)
+        taken = []
+        while True:
+            result = self.delay_queue_pop(*(args + (count - len(taken),
+                                                    len(taken))))
+            items = taken + result[1:]
+            wait = int(result[0]) / 1000.
+            if items or not block:
+                break
+            if timeout is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                wait = remaining if wait < 0 else min(wait, remaining)
+            if wait == 0:
+                continue
+            # A zero timeout would make BLPOP block forever.
+            wait = max(wait, .001) if wait > 0 else 0
+            client = self.client or default_client()
+            item = client.blpop([self.key, self.wakeup_key], timeout=wait)
+            if item is not None and item[0] == self.key:
+                taken = [item[1]]
+        if not items:
+            raise queue.Empty
+        return list(self._decode_many(items))
 
 
-class DefaultDict(Dict):
+class ReliableQueue(Queue):
     """
-    Redis hash <-> Python dict <-> Python's collections.DefaultDict.
+    Queue where each item taken by ``get`` is atomically moved into
+    a processing list for the consumer, using RPOPLPUSH, where it
+    stays until it's acknowledged with ``ack``, or returned to the
+    queue with ``nack``. Items are pushed on the left and taken from
+    the right, so that RPOPLPUSH gives FIFO ordering.
+
+    Each consumer holds a lease that's renewed in the same pipeline
+    as each ``get``, ``ack`` and ``nack``, or with ``touch``, and
+    expires after ``visibility_timeout`` seconds. Calling
+    ``requeue_expired`` from any consumer returns the items held by
+    consumers whose leases have expired to the front of the queue,
+    so items are delivered at least once. This is called by ``get``
+    and ``get_many`` at most once every ``requeue_interval`` seconds
+    (defaulting to ``visibility_timeout``), including while blocked
+    waiting for items.
     """
 
-    def __init__(self, default_factory, *args, **kwargs):
-        self.default_factory = default_factory
-        super(DefaultDict, self).__init__(*args, **kwargs)
+    push_command = "LPUSH"
+    visibility_timeout = 30
+    requeue_interval = None
 
-    def __getitem__(self, key):
-        return self.setdefault(key, self.default_factory())
+    def __init__(self, consumer=None, visibility_timeout=None,
+                 requeue_interval=None, **kwargs):
+        self.consumer = consumer or str(uuid.uuid4())
+        if visibility_timeout is not None:
+            self.visibility_timeout = visibility_timeout
+        if requeue_interval is not None:
+            self.requeue_interval = requeue_interval
+        self.requeued = 0
+        super(ReliableQueue, self).__init__(**kwargs)
+
+    @property
+    def consumers_key(self):
+        return "%s-consumers" % self.key
+
+    @property
+    def processing_key(self):
+        return "%s-processing-%s" % (self.key, self.consumer)
+
+    @property
+    def lease_key(self):
+        return "%s-lease-%s" % (self.key, self.consumer)
+
+    @property
+    def processing(self):
+        """
+        Items taken by this consumer that haven't been acknowledged.
+        """
+        client = self.client or default_client()
+        return self._decode_many(client.lrange(self.processing_key, 0, -1))
+
+    def _leased(self, command=None):
+        """
+        Runs the command, a function given a pipeline, along with
+        renewing the consumer's lease. Returns the command's result.
+        """
+        client = self.client or default_client()
+        pipe = client.pipeline(False)
+        if command is not None:
+            command(pipe)
+        pipe.set(self.lease_key, 1, px=int(self.visibility_timeout * 1000))
+        pipe.sadd(self.consumers_key, self.consumer)
+        return pipe.execute()[0]
+
+    def touch(self):
+        """
+        Renews the consumer's lease while processing a long task.
+        """
+        self._leased()
+
+    def get(self, block=True, timeout=None):
+        return self.get_many(1, block, timeout)[0]
+
+    def _pop_many(self, count, taken):
+        args = (self.key, self.space_key, self.maxsize, count, taken,
+                self.processing_key)
+        return lambda pipe: pipe.queue_pop_many(*args)
+
+    def _requeue_due(self):
+        """
+        Calls ``requeue_expired`` if ``requeue_interval`` has passed
+        since this instance last called it.
+        """
+        interval = self.requeue_interval or self.visibility_timeout
+        now = time.time()
+        if now - self.requeued >= interval:
+            self.requeued = now
+            self.requeue_expired()
+
+    def get_many(self, count, block=True, timeout=None):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        self._requeue_due()
+        items = self._leased(self._pop_many(count, 0))
+        if block:
+            # Blocks for at most requeue_interval at a time, so that
+            # items held by expired consumers are still requeued.
+            interval = self.requeue_interval or self.visibility_timeout
+            deadline = None if timeout is None else time.time() + timeout
+            while not items:
+                wait = interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        break
+                item = self.brpoplpush(self.processing_key, timeout=wait)
+                if item is not None:
+                    pop = self._pop_many(count - 1, 1)
+                    items = [item] + self._leased(pop)
+                else:
+                    self._requeue_due()
+        if not items:
+            raise queue.Empty
+        return list(self._decode_many(items))
+
+    def ack(self, item):
+        """
+        Removes a processed item from the consumer's processing list.
+        Returns False if the item wasn't being processed.
+        """
+        args = (self.processing_key, -1, self._encode(item))
+        return self._leased(lambda pipe: pipe.lrem(*args)) > 0
+
+    def nack(self, item):
+        """
+        Returns an item from the consumer's processing list to the
+        front of the queue. Returns False if the item wasn't being
+        processed.
+        """
+        args = (self.key, self.processing_key, self._encode(item))
+        return self._leased(lambda pipe: pipe.reliable_queue_nack(*args)) > 0
+
+    def requeue_expired(self):
+        """
+        Returns the items held by consumers with expired leases to
+        the front of the queue, and returns the number of items.
+        """
+        prefixes = ("%s-processing-" % self.key, "%s-lease-" % self.key)
+        return self.reliable_queue_requeue(self.consumers_key, *prefixes)
+
+    def delete(self):
+        super(ReliableQueue, self).delete()
+        client = self.client or default_client()
+        consumers = client.smembers(self.consumers_key) | {self.consumer}
+        keys = [self.consumers_key]
+        for consumer in consumers:
+            keys.append("%s-processing-%s" % (self.key, consumer))
+            keys.append("%s-lease-%s" % (self.key, consumer))
+        client.delete(*keys)
 
 
-class MultiSet(Dict):
+class StreamQueue(Base):
     """
-    Redis hash <-> Python dict <-> Python's collections.Counter.
+    Redis stream <-> Queue, consumed via a consumer group, so that
+    any number of consumers across processes and hosts can share the
+    work, with each item delivered to a single consumer.
+
+    Items taken by ``get`` or ``get_many`` remain pending in the
+    group until acknowledged, either in order with ``task_done``, or
+    by entry ID with ``ack``, using the IDs returned by
+    ``get_entries``. When ``claim_idle`` is given, items that have
+    been pending for longer than that many seconds, for example with
+    a consumer that crashed, are claimed with XAUTOCLAIM before
+    reading new items. The stream is trimmed to approximately
+    ``maxlen`` entries on each put, which never blocks, so the queue
+    is never ``full``. Since acknowledged items remain in the stream,
+    ``qsize`` counts the items not yet delivered to the group, and
+    ``join`` polls until there are none, and none are pending.
+
+    The group's throughput can be measured from the change over time
+    in the ``entries_read`` count returned by ``info``.
     """
 
-    def __init__(self, iterable=None, key=None, **kwargs):
-        super(MultiSet, self).__init__(key=key)
-        self.update(iterable=iterable, **kwargs)
+    group = "hot_redis"
+    maxlen = None
+    claim_idle = None
+    join_poll_interval = .1
+
+    def __init__(self, maxlen=None, group=None, consumer=None,
+                 claim_idle=None, **kwargs):
+        if maxlen is not None:
+            self.maxlen = maxlen
+        if group is not None:
+            self.group = group
+        if claim_idle is not None:
+            self.claim_idle = claim_idle
+        self.consumer = consumer or str(uuid.uuid4())
+        self.delivered = collections.deque()
+        self.group_created = False
+        super(StreamQueue, self).__init__(**kwargs)
 
     @property
     def value(self):
-        value = super(MultiSet, self).value
-        kwargs = dict([(k, int(v)) for k, v in value.items()])
-        return collections.Counter(**kwargs)
+        return self._fetch_value(self.xrange())
 
-    __add__  = op_left(operator.add)
-    __sub__  = op_left(operator.sub)
-    __and__  = op_left(operator.and_)
+    @value.setter
+    def value(self, value):
+        self.put_many(value)
+
+    def _fetch_command(self):
+        return "xrange", (self.key,)
+
+    def _fetch_value(self, raw):
+        return [item for _, item in self._decode_entries(raw)]
+
+    def __len__(self):
+        return self.xlen()
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def _decode_entries(self, entries):
+        # Entries trimmed from the stream while pending have no fields.
+        entries = [(id, fields) for id, fields in entries if fields]
+        items = self._decode_many([fields["item"] for _, fields in entries])
+        return list(zip([id for id, _ in entries], items))
+
+    def delete(self):
+        self.group_created = False
+        self._dispatch("delete")()
+
+    def _create_group(self, force=False):
+        if self.group_created and not force:
+            return
+        try:
+            self.xgroup_create(self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.group_created = True
+
+    def put(self, item, block=True, timeout=None):
+        self.put_many([item])
+
+    def put_nowait(self, item):
+        self.put(item)
+
+    def put_many(self, items):
+        args = ("*", self.maxlen, self.maxlen is not None)
+        self._multi(*[("xadd", (self.key, {"item": item}) + args)
+                      for item in self._encode_many(list(items))])
+
+    def claim(self, idle, count=100):
+        """
+        Claims up to ``count`` items that have been pending for at
+        least ``idle`` seconds, returning (ID, item) pairs.
+        """
+        self._create_group()
+        result = self.xautoclaim(self.group, self.consumer,
+                                 int(idle * 1000), "0-0", count=count)
+        entries = self._decode_entries(result[1])
+        ids = [id for id, _ in entries]
+        # Entries reclaimed by the same consumer aren't tracked twice.
+        self.release(*ids)
+        self.delivered.extend(ids)
+        return entries
+
+    def get_entries(self, count=1, block=True, timeout=None):
+        """
+        Takes up to ``count`` items, returning (ID, item) pairs.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        self._create_group()
+        if self.claim_idle is not None:
+            entries = self.claim(self.claim_idle, count)
+            if entries:
+                return entries
+        kwargs = {"count": count}
+        if block:
+            # BLOCK takes milliseconds, with 0 blocking forever.
+            timeout = 0 if timeout is None else max(int(timeout * 1000), 1)
+            kwargs["block"] = timeout
+        streams = {self.key: ">"}
+        client = self.client or default_client()
+        try:
+            response = client.xreadgroup(self.group, self.consumer,
+                                         streams, **kwargs)
+        except redis.exceptions.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            # The stream was deleted since the group was created.
+            self._create_group(force=True)
+            response = client.xreadgroup(self.group, self.consumer,
+                                         streams, **kwargs)
+        entries = self._decode_entries(response[0][1] if response else [])
+        if not entries:
+            raise queue.Empty
+        self.delivered.extend([id for id, _ in entries])
+        return entries
+
+    def get(self, block=True, timeout=None):
+        return self.get_entries(1, block, timeout)[0][1]
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def get_many(self, count, block=True, timeout=None):
+        return [item for _, item in self.get_entries(count, block, timeout)]
+
+    def ack(self, *ids):
+        """
+        Acknowledges the items with the given entry IDs.
+        """
+        self.release(*ids)
+        return self.xack(self.group, *ids)
+
+    def release(self, *ids):
+        """
+        Stops tracking the items with the given entry IDs for
+        ``task_done``, without acknowledging them, so that they
+        stay pending for a consumer to claim.
+        """
+        for id in ids:
+            try:
+                self.delivered.remove(id)
+            except ValueError:
+                pass
+
+    def task_done(self):
+        """
+        Acknowledges the oldest item taken by this consumer.
+        """
+        if not self.delivered:
+            raise ValueError("task_done() called too many times")
+        self.xack(self.group, self.delivered.popleft())
+
+    def _undelivered(self, info):
+        """
+        Returns the number of entries not yet delivered to the group,
+        given the result of ``info``. Redis 7 reports this as the
+        group's lag, unless it can't be determined, otherwise the
+        entries after the last delivered ID are counted.
+        """
+        if info.get("lag") is not None:
+            return info["lag"]
+        last = info["last_delivered_id"]
+        return len([id for id, _ in self.xrange(min=last) if id != last])
+
+    def qsize(self):
+        return self._undelivered(self.info())
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return False
+
+    def join(self):
+        """
+        Blocks until every item has been delivered and acknowledged.
+        Streams don't signal acknowledgements, so the group is polled
+        every ``join_poll_interval`` seconds.
+        """
+        while True:
+            info = self.info()
+            if not info["pending"] and not self._undelivered(info):
+                return
+            time.sleep(self.join_poll_interval)
+
+    def info(self):
+        """
+        Returns the stream's length, along with the group's counts
+        of consumers, pending items, and for Redis 7, the total
+        entries read and the lag of entries not yet read.
+        """
+        self._create_group()
+        client = self.client or default_client()
+        pipe = client.pipeline(False)
+        pipe.xlen(self.key)
+        pipe.xinfo_groups(self.key)
+        length, groups = pipe.execute()
+        info = {"length": length}
+        for group in groups:
+            if group["name"] == self.group:
+                for name, value in group.items():
+                    info[name.replace("-", "_")] = value
+        return info
+
+
+####################################################################
+#                                                                  #
+#  Next up, some lock structures from the threading module. The    #
+#  semaphores are backed by the above Queue class, since it        #
+#  provides the blocking / non-blocking mechanics desired. Blocked #
+#  acquires register as waiting and BLPOP on the queue's space     #
+#  list, which each release pushes a token onto for a registered   #
+#  waiter, so waiters are woken on release without polling. Locks  #
+#  use a key holding the owner's token with a lease, and wait on   #
+#  their own list of release tokens.                               #
+#                                                                  #
+####################################################################
+
+class BoundedSemaphore(Queue):
+    """
+    Redis list <-> Python list <-> Queue <-> threading.BoundedSemaphore.
+
+    BoundedSemaphore's ``value`` arg maps to Queue's ``maxsize``.
+    BoundedSemaphore's acquire/release methods maps to Queue's put/get
+    methods repectively, providing blocking/timeout mechanics. Each
+    release is a single call to the ``queue_pop`` atom, which also
+    pushes a token for a blocked acquire, if any, waking it.
+    Unfinished tasks aren't tracked, since they don't apply to
+    semaphores.
+    """
+
+    maxsize = 1
+    track_tasks = False
+
+    def __init__(self, value=None, **kwargs):
+        super(BoundedSemaphore, self).__init__(value, **kwargs)
+
+    def acquire(self, block=True, timeout=None):
+        try:
+            self.put(1, block, timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def release(self):
+        try:
+            self.get(block=False)
+        except queue.Empty:
+            raise RuntimeError("Cannot release unacquired lock")
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+
+class Semaphore(BoundedSemaphore):
+    """
+    Redis list <-> Python list <-> Queue <-> threading.Semaphore.
+
+    Same implementation as BoundedSemaphore, but without a queue size.
+    """
+
+    def release(self):
+        try:
+            super(Semaphore, self).release()
+        except RuntimeError:
+            pass
+
+
+class Lock(Base):
+    """
+    Redis string <-> threading.Lock.
+
+    The lock is held by setting its key to a token unique to each
+    acquire, with a lease that expires after ``lease_time`` seconds,
+    so that a lock held by a process that dies is eventually freed.
+    While held, the lease is renewed in a background thread, unless
+    ``renew`` is False. Only the holder of the token can release the
+    lock, using a compare-and-delete atom, which also pushes a token
+    onto a "release" list, that blocked acquires wait on with BLPOP,
+    for no longer than the remaining lease.
+    """
+
+    lease_time = 30
+    renew = True
+
+    def __init__(self, lease_time=None, renew=None, **kwargs):
+        if lease_time is not None:
+            self.lease_time = lease_time
+        if renew is not None:
+            self.renew = renew
+        self.token = None
+        self.renewing = None
+        super(Lock, self).__init__(**kwargs)
+
+    @property
+    def release_key(self):
+        return "%s-release" % self.key
+
+    @property
+    def value(self):
+        return self.get()
+
+    @property
+    def owner(self):
+        """
+        Token of the current holder, or None if not held.
+        """
+        return self.get()
+
+    @property
+    def ttl(self):
+        """
+        Seconds until the current lease expires, or None if not held.
+        """
+        ttl = self.pttl()
+        return ttl / 1000. if ttl >= 0 else None
+
+    def locked(self):
+        return self.exists() > 0
+
+    def delete(self):
+        self._dispatch("delete")(self.release_key)
+
+    def acquire(self, block=True, timeout=None):
+        token = str(uuid.uuid4())
+        lease = int(self.lease_time * 1000)
+        if timeout is not None:
+            deadline = time.time() + timeout
+        client = self.client or default_client()
+        while True:
+            pipe = client.pipeline(False)
+            pipe.set(self.key, token, nx=True, px=lease)
+            pipe.pttl(self.key)
+            acquired, ttl = pipe.execute()
+            if acquired:
+                break
+            if not block:
+                return False
+            # Wait until released, or until the lease expires, with
+            # a zero timeout making BLPOP block forever.
+            wait = ttl / 1000. if ttl > 0 else 0
+            if timeout is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining) if wait else remaining
+            if ttl != -2:
+                wait = max(wait, .001) if wait else 0
+                client.blpop(self.release_key, timeout=wait)
+        self.token = token
+        if self.renew:
+            self.renewing = threading.Event()
+            thread = threading.Thread(target=self._renew,
+                                      args=(token, self.renewing))
+            thread.daemon = True
+            thread.start()
+        return True
+
+    def _renew(self, token, stopped):
+        """
+        Renews the lease every third of ``lease_time``, until
+        released or the lease is lost.
+        """
+        lease = int(self.lease_time * 1000)
+        while not stopped.wait(self.lease_time / 3.):
+            try:
+                if not self.lock_renew(token, lease):
+                    break
+            except redis.exceptions.ConnectionError:
+                pass
+
+    def release(self):
+        token, self.token = self.token, None
+        if self.renewing is not None:
+            self.renewing.set()
+            self.renewing = None
+        lease = int(self.lease_time * 1000)
+        released = token is not None and self.lock_release(
+            token, self.release_key, lease)
+        if not released:
+            raise RuntimeError("Cannot release unacquired lock")
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+
+class RLock(Lock):
+    """
+    Redis string <-> threading.RLock.
+
+    Same implementation as Lock, but as per re-entrant locks, can be
+    acquired multiple times by the thread holding it. The depth of
+    acquires is tracked per thread locally, so only the outermost
+    acquire and release make calls to Redis.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.local = threading.local()
+        super(RLock, self).__init__(*args, **kwargs)
+
+    @property
+    def depth(self):
+        return getattr(self.local, "depth", 0)
+
+    def acquire(self, block=True, timeout=None):
+        depth = self.depth
+        if depth == 0 and not super(RLock, self).acquire(block, timeout):
+            return False
+        self.local.depth = depth + 1
+        return True
+
+    def release(self):
+        depth = self.depth
+        if depth == 0:
+            raise RuntimeError("Cannot release unacquired lock")
+        self.local.depth = depth - 1
+        if depth == 1:
+            super(RLock, self).release()
+
+
+class ReadWriteLock(Base):
+    """
+    Redis string + Redis sorted set <-> read-write lock.
+
+    Any number of readers can hold the lock at once, while a writer
+    holds it exclusively. The writer's token is stored in the main
+    key, and readers' tokens in a sorted set, scored by when their
+    leases expire, after ``lease_time`` seconds. A writer waiting for
+    the lock registers its intent to write, which stops new readers
+    from acquiring it, so that writers aren't starved.
+
+    Each acquire and release is a single Lua atom. Blocked acquires
+    subscribe to a channel that releases publish to, waiting no
+    longer than until the blocking leases expire.
+    """
+
+    lease_time = 30
+
+    def __init__(self, lease_time=None, **kwargs):
+        if lease_time is not None:
+            self.lease_time = lease_time
+        self.local = threading.local()
+        super(ReadWriteLock, self).__init__(**kwargs)
+
+    @property
+    def readers_key(self):
+        return "%s-readers" % self.key
+
+    @property
+    def intent_key(self):
+        return "%s-intent" % self.key
+
+    @property
+    def channel(self):
+        return "%s-channel" % self.key
+
+    @property
+    def value(self):
+        client = self.client or default_client()
+        pipe = client.pipeline(False)
+        pipe.get(self.key)
+        pipe.zrange(self.readers_key, 0, -1)
+        writer, readers = pipe.execute()
+        return {"writer": writer, "readers": readers}
+
+    def delete(self):
+        self._dispatch("delete")(self.readers_key, self.intent_key)
+
+    def _tokens(self, name):
+        """
+        Returns the list of tokens held by the current thread for
+        the given lock type, read or write.
+        """
+        try:
+            return getattr(self.local, name)
+        except AttributeError:
+            setattr(self.local, name, [])
+            return getattr(self.local, name)
+
+    def _acquire(self, atom, token, block, timeout):
+        args = (self.readers_key, self.intent_key, token,
+                int(self.lease_time * 1000))
+        if atom(*args) == 0:
+            return True
+        if not block:
+            return False
+        if timeout is not None:
+            deadline = time.time() + timeout
+        # Subscribe before trying again, so that a release between
+        # the two isn't missed.
+        pubsub = self._subscribe(self.channel)
+        try:
+            while True:
+                wait = atom(*args)
+                if wait == 0:
+                    return True
+                wait = wait / 1000.
+                if timeout is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                pubsub.get_message(timeout=wait)
+        finally:
+            pubsub.close()
+
+    def acquire_read(self, block=True, timeout=None):
+        token = str(uuid.uuid4())
+        if not self._acquire(self.rwlock_acquire_read, token, block,
+                             timeout):
+            return False
+        self._tokens("read").append(token)
+        return True
+
+    def acquire_write(self, block=True, timeout=None):
+        token = str(uuid.uuid4())
+        if not self._acquire(self.rwlock_acquire_write, token, block,
+                             timeout):
+            # Withdraw the intent to write, so readers can continue.
+            self.rwlock_release_write(self.readers_key, self.intent_key,
+                                      token, self.channel)
+            return False
+        self._tokens("write").append(token)
+        return True
+
+    def release_read(self):
+        tokens = self._tokens("read")
+        released = tokens and self.rwlock_release_read(
+            self.readers_key, self.intent_key, tokens.pop(), self.channel)
+        if not released:
+            raise RuntimeError("Cannot release unacquired lock")
+
+    def release_write(self):
+        tokens = self._tokens("write")
+        released = tokens and self.rwlock_release_write(
+            self.readers_key, self.intent_key, tokens.pop(), self.channel)
+        if not released:
+            raise RuntimeError("Cannot release unacquired lock")
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class Event(Base):
+    """
+    Redis string <-> threading.Event.
+
+    The flag is set while the key exists. Waiters subscribe to a
+    channel that ``set`` publishes to, so that they're woken as soon
+    as the flag is set, without polling.
+    """
+
+    @property
+    def channel(self):
+        return "%s-channel" % self.key
+
+    @property
+    def value(self):
+        return self.is_set()
+
+    @value.setter
+    def value(self, value):
+        if value:
+            self.set()
+        else:
+            self.clear()
+
+    def is_set(self):
+        return self.exists() > 0
+
+    def set(self):
+        self._multi(("set", (self.key, 1)),
+                    ("publish", (self.channel, 1)))
+
+    def clear(self):
+        self.delete()
+
+    def wait(self, timeout=None):
+        if self.is_set():
+            return True
+        if timeout is not None:
+            deadline = time.time() + timeout
+        pubsub = self._subscribe(self.channel)
+        try:
+            # Checked again once subscribed, in case the flag was set
+            # before the subscription.
+            while not self.is_set():
+                remaining = None
+                if timeout is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                pubsub.get_message(timeout=remaining)
+            return True
+        finally:
+            pubsub.close()
+
+
+class Condition(Base):
+    """
+    Redis list <-> threading.Condition.
+
+    The list holds a token for each waiting thread, in the order they
+    started waiting. ``notify`` moves up to ``n`` of these with a
+    single atom, pushing onto each waiter's own list, which the waiter
+    blocks on with BLPOP. The ``lock`` must be one of the HOT Redis
+    locks so that it's shared between processes, and defaults to an
+    RLock using the key "<key>-lock".
+    """
+
+    def __init__(self, lock=None, **kwargs):
+        super(Condition, self).__init__(**kwargs)
+        if lock is None:
+            lock = RLock(key="%s-lock" % self.key, client=self.client)
+        self.lock = lock
+
+    @property
+    def value(self):
+        return self.lrange(0, -1)
+
+    def acquire(self, *args, **kwargs):
+        return self.lock.acquire(*args, **kwargs)
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        return self.lock.__enter__()
+
+    def __exit__(self, t, v, tb):
+        return self.lock.__exit__(t, v, tb)
+
+    def _is_owned(self):
+        if isinstance(self.lock, RLock):
+            return self.lock.depth > 0
+        return self.lock.token is not None
+
+    def wait(self, timeout=None):
+        if not self._is_owned():
+            raise RuntimeError("Cannot wait on unacquired lock")
+        token = str(uuid.uuid4())
+        notify_key = "%s-notify-%s" % (self.key, token)
+        self.rpush(token)
+        # An RLock is released fully however many times it's been
+        # acquired, and its depth restored once acquired again.
+        depth = getattr(self.lock, "depth", 1)
+        if depth > 1:
+            self.lock.local.depth = 1
+        self.lock.release()
+        try:
+            client = self.client or default_client()
+            wait = max(timeout, .001) if timeout is not None else 0
+            notified = client.blpop(notify_key, timeout=wait) is not None
+            if not notified:
+                # If our token's no longer waiting, we were notified
+                # after timing out, so the notification isn't lost.
+                pipe = client.pipeline()
+                pipe.lrem(self.key, 0, token)
+                pipe.delete(notify_key)
+                notified = pipe.execute()[0] == 0
+        finally:
+            self.lock.acquire()
+            if depth > 1:
+                self.lock.local.depth = depth
+        return notified
+
+    def wait_for(self, predicate, timeout=None):
+        deadline = None
+        wait = timeout
+        result = predicate()
+        while not result:
+            if wait is not None:
+                if deadline is None:
+                    deadline = time.time() + wait
+                else:
+                    wait = deadline - time.time()
+                    if wait <= 0:
+                        break
+            self.wait(wait)
+            result = predicate()
+        return result
+
+    def notify(self, n=1):
+        if not self._is_owned():
+            raise RuntimeError("Cannot notify on unacquired lock")
+        self.condition_notify(n)
+
+    def notify_all(self):
+        self.notify(-1)
+
+
+try:
+    BrokenBarrierError = threading.BrokenBarrierError
+except AttributeError:
+    # Python 2.
+    class BrokenBarrierError(RuntimeError):
+        pass
+
+
+class Barrier(Base):
+    """
+    Redis hash <-> threading.Barrier.
+
+    The hash holds the count of parties waiting, the current
+    generation, and whether the barrier is broken. Each party arriving
+    increments the count with a single atom, and blocks with BLPOP on
+    a list for its generation. The last party to arrive starts the
+    next generation, runs the ``action`` if given, and then pushes a
+    token for each of the other parties, flagging whether they passed
+    or the barrier was broken.
+    """
+
+    def __init__(self, parties, action=None, timeout=None, **kwargs):
+        self.parties = parties
+        self.action = action
+        self.timeout = timeout
+        super(Barrier, self).__init__(**kwargs)
+
+    @property
+    def value(self):
+        return self.hgetall()
+
+    @property
+    def n_waiting(self):
+        return int(self.hget("count") or 0)
+
+    @property
+    def broken(self):
+        return bool(self.hexists("broken"))
+
+    def release_key(self, generation):
+        return "%s-release-%s" % (self.key, generation)
+
+    def _release(self, generation, passed):
+        if self.parties > 1:
+            tokens = [int(passed)] * (self.parties - 1)
+            client = self.client or default_client()
+            client.rpush(self.release_key(generation), *tokens)
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        index, generation = self.barrier_wait(self.parties)
+        if index < 0:
+            raise BrokenBarrierError
+        if index == self.parties - 1:
+            try:
+                if self.action is not None:
+                    self.action()
+            except:
+                self.abort()
+                self._release(generation, False)
+                raise
+            self._release(generation, True)
+            return index
+        client = self.client or default_client()
+        wait = max(timeout, .001) if timeout is not None else 0
+        released = client.blpop(self.release_key(generation), timeout=wait)
+        if released is None:
+            # Timing out breaks the barrier, unless our generation was
+            # released in the meantime, in which case the last party
+            # is running the action, and will push our token after.
+            if self.barrier_break(0, generation):
+                raise BrokenBarrierError
+            released = client.blpop(self.release_key(generation))
+        if not int(released[1]):
+            raise BrokenBarrierError
+        return index
+
+    def reset(self):
+        self.barrier_break(1, "")
+
+    def abort(self):
+        self.barrier_break(0, "")
+
+
+#####################################################################
+#                                                                   #
+#  Some members from Python's collections standard library module.  #
+#                                                                   #
+#####################################################################
+
+
+class DefaultDict(Dict):
+    """
+    Redis hash <-> Python dict <-> Python's collections.DefaultDict.
+    """
+
+    def __init__(self, default_factory, *args, **kwargs):
+        self.default_factory = default_factory
+        super(DefaultDict, self).__init__(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self.setdefault(key, self.default_factory())
+
+
+class Counting(Base):
+    """
+    Base class for multiset types and relevant operators. Subclasses
+    implement ``_increment``, returning the command that adds to a
+    single count in their own storage.
+    """
+
+    chunk_size = 10000
+
+    def __init__(self, iterable=None, key=None, **kwargs):
+        super(Counting, self).__init__(key=key)
+        self.update(iterable=iterable, **kwargs)
+
+    __add__  = op_left(operator.add)
+    __sub__  = op_left(operator.sub)
+    __and__  = op_left(operator.and_)
     __or__   = op_left(operator.or_)
     __radd__ = op_right(operator.add)
     __rsub__ = op_right(operator.sub)
@@ -840,6 +2611,57 @@ class MultiSet(Dict):
     __iand__ = inplace("intersection_update")
     __ior__  = inplace("union_update")
 
+    def __repr__(self):
+        bits = (self.__class__.__name__, repr(dict(self.value)), self.key)
+        return "%s(%s, '%s')" % bits
+
+    def _merge(self, iterable=None, **kwargs):
+        # Counts are aggregated locally first with Counter, which uses
+        # its C helper for counting iterables where available, so
+        # each distinct key is only sent to Redis once.
+        counts = collections.Counter()
+        if isinstance(iterable, Base):
+            iterable = iterable.value
+        if iterable:
+            counts.update(iterable)
+        counts.update(kwargs)
+        return counts.items()
+
+    def _increment(self, name, amount):
+        """
+        Returns the (name, args) command for adding the given amount
+        to the count for the given name.
+        """
+        raise NotImplementedError
+
+    def _update(self, iterable, multiplier, **kwargs):
+        # Increments are sent in pipelines of up to chunk_size commands,
+        # rather than a round trip per key, so that a huge update isn't
+        # held in a single MULTI that blocks the server while it runs.
+        # Each chunk is applied atomically, but the update as a whole
+        # is only atomic within transaction().
+        items = list(self._merge(iterable, **kwargs))
+        for i in range(0, len(items), self.chunk_size):
+            self._multi(*[self._increment(k, v * multiplier)
+                          for k, v in items[i:i + self.chunk_size]])
+
+    def update(self, iterable=None, **kwargs):
+        self._update(iterable, 1, **kwargs)
+
+    def subtract(self, iterable=None, **kwargs):
+        self._update(iterable, -1, **kwargs)
+
+
+class MultiSet(Counting, Dict):
+    """
+    Redis hash <-> Python dict <-> Python's collections.Counter.
+    """
+
+    def _fetch_value(self, raw):
+        value = super(MultiSet, self)._fetch_value(raw)
+        kwargs = dict([(k, int(v)) for k, v in value.items()])
+        return collections.Counter(**kwargs)
+
     # Return 0 as a default, which allows bitwise ops to work correctly
     # in Python 3, as its Counter type no longer supports working with
     # missing values.
@@ -855,10 +2677,6 @@ class MultiSet(Dict):
         except KeyError:
             pass
 
-    def __repr__(self):
-        bits = (self.__class__.__name__, repr(dict(self.value)), self.key)
-        return "%s(%s, '%s')" % bits
-
     def values(self):
         values = super(MultiSet, self).values()
         return [int(v) for v in values]
@@ -867,37 +2685,13 @@ class MultiSet(Dict):
         value = self.hget(key)
         return int(value) if value is not None else default
 
-    def _merge(self, iterable=None, **kwargs):
-        if iterable:
-            try:
-                try:
-                    # Python 2.
-                    items = iterable.iteritems()
-                except AttributeError:
-                    # Python 3.
-                    items = iterable.items()
-            except AttributeError:
-                for k in iterable:
-                    kwargs[k] = kwargs.get(k, 0) + 1
-            else:
-                for k, v in items:
-                    kwargs[k] = kwargs.get(k, 0) + v
-        return kwargs.items()
-
     def _flatten(self, iterable, **kwargs):
         for k, v in self._merge(iterable, **kwargs):
             yield k
             yield v
 
-    def _update(self, iterable, multiplier, **kwargs):
-        for k, v in self._merge(iterable, **kwargs):
-            self.hincrby(k, v * multiplier)
-
-    def update(self, iterable=None, **kwargs):
-        self._update(iterable, 1, **kwargs)
-
-    def subtract(self, iterable=None, **kwargs):
-        self._update(iterable, -1, **kwargs)
+    def _increment(self, name, amount):
+        return "hincrby", (self.key, name, amount)
 
     def intersection_update(self, iterable=None, **kwargs):
         self.multiset_intersection_update(*self._flatten(iterable, **kwargs))
@@ -917,3 +2711,196 @@ class MultiSet(Dict):
         return values
 
 collections.MutableMapping.register(MultiSet)
+
+
+class SortedMultiSet(Counting):
+    """
+    Redis sorted set <-> Python's collections.Counter.
+
+    Same interface as MultiSet, but each count is stored as the score
+    of its member, so that ``most_common`` reads only the ``n`` members
+    asked for, in order, with ZREVRANGE, rather than reading and
+    sorting every count in Python. The in-place operators are applied
+    within Redis with ZINTERSTORE and ZUNIONSTORE, removing members
+    whose counts aren't positive, as per Counter.
+    """
+
+    @property
+    def value(self):
+        return self._fetch_value(self.zrange(0, -1, withscores=True))
+
+    def _fetch_command(self):
+        return "zrange", (self.key, 0, -1, False, True)
+
+    def _fetch_value(self, raw):
+        return collections.Counter(dict([(k, int(v)) for k, v in raw]))
+
+    def __len__(self):
+        return self.zcard()
+
+    def __contains__(self, name):
+        return self.zscore(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, name):
+        return self.get(name, 0)
+
+    def __setitem__(self, name, value):
+        self.zadd({name: value})
+
+    def __delitem__(self, name):
+        self.zrem(name)
+
+    def keys(self):
+        return self.zrange(0, -1)
+
+    def values(self):
+        return list(self.value.values())
+
+    def items(self):
+        return list(self.value.items())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, name, default=None):
+        value = self.zscore(name)
+        return int(value) if value is not None else default
+
+    def has_key(self, name):
+        return name in self
+
+    def setdefault(self, name, value=None):
+        # Scores can't be None, so a missing count defaults to 0.
+        self.zadd({name: value or 0}, nx=True)
+        return self.get(name)
+
+    def pop(self, name, *default):
+        value = self.get(name)
+        # Only returned if this call removed it.
+        if value is None or not self.zrem(name):
+            if default:
+                return default[0]
+            raise KeyError(name)
+        return value
+
+    def copy(self):
+        return self.__class__(self.value)
+
+    def clear(self):
+        self.delete()
+
+    def _increment(self, name, amount):
+        return "zincrby", (self.key, amount, name)
+
+    def _store(self, command, aggregate, iterable, **kwargs):
+        """
+        Stores the result of ZINTERSTORE or ZUNIONSTORE between this
+        sorted set and the given counts, using the other's key
+        directly when it's also a SortedMultiSet, and then removes
+        members whose counts aren't positive.
+        """
+        temp = not isinstance(iterable, SortedMultiSet) or kwargs
+        if temp:
+            other = "%s-%s" % (self.key, uuid.uuid4())
+            counts = dict(self._merge(iterable, **kwargs))
+            commands = [("zadd", (other, counts))] if counts else []
+        else:
+            other = iterable.key
+            commands = []
+        commands.append((command, (self.key, [self.key, other], aggregate)))
+        commands.append(("zremrangebyscore", (self.key, "-inf", 0)))
+        if temp:
+            commands.append(("delete", (other,)))
+        self._multi(*commands)
+
+    def intersection_update(self, iterable=None, **kwargs):
+        self._store("zinterstore", "MIN", iterable, **kwargs)
+
+    def union_update(self, iterable=None, **kwargs):
+        self._store("zunionstore", "MAX", iterable, **kwargs)
+
+    def elements(self):
+        for k, count in self.zrangebyscore("(0", "+inf", withscores=True):
+            for i in range(int(count)):
+                yield k
+
+    def most_common(self, n=None):
+        if n is not None and n <= 0:
+            return []
+        end = -1 if n is None else n - 1
+        values = self.zrevrange(0, end, withscores=True)
+        return [(k, int(v)) for k, v in values]
+
+collections.MutableMapping.register(SortedMultiSet)
+
+
+####################################################################
+#                                                                  #
+#  Finally, functions for reading many objects in one round trip.  #
+#                                                                  #
+####################################################################
+
+def fetch(*objs, **kwargs):
+    """
+    Returns the values of all the given objects, read with a single
+    pipeline per client. Strings and numbers are grouped together
+    into a single MGET, followed by each of the other types' read
+    commands, such as HGETALL, LRANGE and SMEMBERS. Objects that
+    can't be read with a single command fall back to their ``value``
+    attribute. If the ``snapshot`` arg is True, each object's
+    ``snapshot`` attribute is also set to its value.
+    """
+    snapshot = kwargs.pop("snapshot", False)
+    values = [None] * len(objs)
+    gets = {}
+    commands = {}
+    fallback = []
+    for i, obj in enumerate(objs):
+        command = obj._fetch_command()
+        client = obj.client or default_client()
+        if command is None:
+            fallback.append(i)
+        elif command[0] == "get":
+            gets.setdefault(client, []).append((i, command[1][0]))
+        else:
+            commands.setdefault(client, []).append((i,) + command)
+    for client in set(gets) | set(commands):
+        pipe = client.pipeline(False)
+        client_gets = gets.get(client, [])
+        client_commands = commands.get(client, [])
+        if client_gets:
+            pipe.mget([key for i, key in client_gets])
+        for i, name, args in client_commands:
+            getattr(pipe, name)(*args)
+        results = pipe.execute()
+        if client_gets:
+            for (i, key), raw in zip(client_gets, results.pop(0)):
+                values[i] = objs[i]._fetch_value(raw)
+        for (i, name, args), raw in zip(client_commands, results):
+            values[i] = objs[i]._fetch_value(raw)
+    for i in fallback:
+        values[i] = objs[i].value
+    if snapshot:
+        for obj, value in zip(objs, values):
+            obj.snapshot = value
+    return values
+
+
+def values(objs, **kwargs):
+    """
+    Same as ``fetch``, but given a dict mapping names to objects, and
+    returning a dict mapping the same names to values, eg for
+    building a template context.
+    """
+    names = list(objs.keys())
+    return dict(zip(names, fetch(*[objs[name] for name in names],
+                                 **kwargs)))
@@ -0,0 +1,267 @@
+
+import collections
+import logging
+import threading
+import time
+
+try:
+    # Python 3.
+    import queue
+except ImportError:
+    # Python 2.
+    import Queue as queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Worker(object):
+    """
+    Consumes items from a HOT Redis queue, calling ``handler`` with
+    each item from a pool of ``concurrency`` threads.
+
+    A single fetcher thread takes items in batches with the queue's
+    ``get_many``, and buffers up to ``prefetch`` of them locally.
+    Once the buffer is full, the fetcher blocks until the handler
+    threads catch up, so items aren't taken from the queue faster
+    than they can be handled.
+
+    Once handled, each item is acknowledged in the way the queue
+    supports: by entry ID for StreamQueue, with ``ack`` for
+    ReliableQueue, and with ``task_done`` for all other queues.
+
+    Items whose handler raises an exception are retried up to
+    ``max_retries`` times, before being acknowledged and dropped.
+    ReliableQueue items are returned with ``nack`` after a delay,
+    starting at ``retry_delay`` seconds and doubling with each
+    attempt. StreamQueue entries are left pending, to be reclaimed
+    once idle by a queue with ``claim_idle`` set, and are only
+    counted towards ``max_retries`` when the worker's own queue has
+    ``claim_idle`` set. Other queues can't return items, so failed
+    items are marked as done. Failures are counted for at most
+    ``max_tracked_failures`` items at once, forgetting the oldest.
+
+    Running totals for the worker are kept in ``stats``, from which
+    ``throughput`` and ``latency`` are calculated.
+    """
+
+    max_tracked_failures = 10000
+
+    def __init__(self, queue, handler, concurrency=1, prefetch=None,
+                 poll_interval=1, max_retries=3, retry_delay=1):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.prefetch = prefetch or concurrency * 2
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.buffer = None
+        self.threads = []
+        self.failures = collections.OrderedDict()
+        self.retrying = {}
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {
+            "fetched": 0,
+            "processed": 0,
+            "failed": 0,
+            "handler_time": 0.,
+            "max_handler_time": 0.,
+            "started": None,
+            "stopped": None,
+        }
+
+    @property
+    def throughput(self):
+        """
+        Items handled per second since the worker was started.
+        """
+        if self.stats["started"] is None:
+            return 0.
+        stopped = self.stats["stopped"] or time.time()
+        elapsed = stopped - self.stats["started"]
+        handled = self.stats["processed"] + self.stats["failed"]
+        return handled / elapsed if elapsed > 0 else 0.
+
+    @property
+    def latency(self):
+        """
+        Average time in seconds spent handling each item.
+        """
+        handled = self.stats["processed"] + self.stats["failed"]
+        if not handled:
+            return 0.
+        return self.stats["handler_time"] / handled
+
+    def start(self):
+        self.stopping.clear()
+        self.buffer = queue.Queue(self.prefetch)
+        self.stats["started"] = time.time()
+        self.stats["stopped"] = None
+        self.threads = [threading.Thread(target=self.fetch)]
+        for _ in range(self.concurrency):
+            self.threads.append(threading.Thread(target=self.work))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self, wait=True):
+        """
+        Stops taking items from the queue. Items already taken are
+        handled before the handler threads exit.
+        """
+        self.stopping.set()
+        if wait:
+            self.join()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+        if not any([thread.is_alive() for thread in self.threads]):
+            # Items waiting to be retried are returned right away,
+            # rather than being left in the processing list.
+            for timer in list(self.retrying):
+                timer.cancel()
+                self.nack(timer)
+            self.stats["stopped"] = self.stats["stopped"] or time.time()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, t, v, tb):
+        self.stop()
+
+    def get_many(self, count):
+        """
+        Takes up to ``count`` items from the queue, returning them
+        as (ID, item) pairs, where the ID is only used for queues
+        that acknowledge items by entry ID.
+        """
+        if hasattr(self.queue, "get_entries"):
+            return self.queue.get_entries(count, timeout=self.poll_interval)
+        if hasattr(self.queue, "get_many"):
+            items = self.queue.get_many(count, timeout=self.poll_interval)
+        else:
+            items = [self.queue.get(timeout=self.poll_interval)]
+        return [(None, item) for item in items]
+
+    def fetch(self):
+        try:
+            while not self.stopping.is_set():
+                count = max(self.prefetch - self.buffer.qsize(), 1)
+                try:
+                    entries = self.get_many(count)
+                except queue.Empty:
+                    continue
+                except Exception:
+                    logger.exception("Error taking items from %r", self.queue)
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                with self.lock:
+                    self.stats["fetched"] += len(entries)
+                for entry in entries:
+                    # Blocks while the buffer is full.
+                    self.buffer.put(entry)
+        finally:
+            for _ in range(self.concurrency):
+                self.buffer.put(None)
+
+    def work(self):
+        while True:
+            entry = self.buffer.get()
+            if entry is None:
+                break
+            id, item = entry
+            start = time.time()
+            try:
+                self.handler(item)
+            except Exception:
+                logger.exception("Error handling %r", item)
+                success = False
+            else:
+                success = True
+            elapsed = time.time() - start
+            with self.lock:
+                self.stats["processed" if success else "failed"] += 1
+                self.stats["handler_time"] += elapsed
+                if elapsed > self.stats["max_handler_time"]:
+                    self.stats["max_handler_time"] = elapsed
+            try:
+                self.done(id, item, success)
+            except Exception:
+                logger.exception("Error acknowledging %r", item)
+
+    def done(self, id, item, success):
+        """
+        Acknowledges a handled item on the queue, unless it failed
+        and will be retried.
+        """
+        if not success and self.retry(id, item):
+            return
+        if success and self.failures:
+            with self.lock:
+                self.failures.pop(self.failure_key(id, item), None)
+        if id is not None:
+            self.queue.ack(id)
+            return
+        if hasattr(self.queue, "ack"):
+            self.queue.ack(item)
+        if hasattr(self.queue, "task_done"):
+            self.queue.task_done()
+
+    def retry(self, id, item):
+        """
+        Counts a failed attempt at handling an item, returning True
+        if it will be retried, or False once ``max_retries`` is
+        exceeded, or if the queue can't return items.
+        """
+        if id is None and not hasattr(self.queue, "nack"):
+            return False
+        if id is not None:
+            # Left pending, and reclaimed with a new delivery, so
+            # task_done shouldn't acknowledge it in the meantime.
+            self.queue.release(id)
+            if self.queue.claim_idle is None:
+                # Only another consumer can claim it, so there's
+                # nothing to count.
+                return True
+        key = self.failure_key(id, item)
+        with self.lock:
+            attempts = self.failures.pop(key, 0) + 1
+            if attempts <= self.max_retries:
+                self.failures[key] = attempts
+                while len(self.failures) > self.max_tracked_failures:
+                    self.failures.popitem(last=False)
+        if attempts > self.max_retries:
+            logger.error("Giving up on %r after %s attempts", item, attempts)
+            return False
+        if id is None:
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            timer = threading.Timer(delay, lambda: self.nack(timer))
+            timer.daemon = True
+            with self.lock:
+                self.retrying[timer] = item
+            timer.start()
+        return True
+
+    def failure_key(self, id, item):
+        """
+        Returns the key that failures are counted by: the entry ID,
+        or the item's stored form, since decoded items may not be
+        hashable.
+        """
+        return id if id is not None else self.queue._encode(item)
+
+    def nack(self, timer):
+        """
+        Returns an item to the queue once its retry delay has passed.
+        """
+        with self.lock:
+            item = self.retrying.pop(timer, self)
+        if item is not self:
+            try:
+                self.queue.nack(item)
+            except Exception:
+                logger.exception("Error returning %r", item)